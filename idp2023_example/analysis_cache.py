@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+class AnalysisCache:
+    """Size-bounded on-disk cache of intermediate analysis results.
+
+    Entries are keyed by a hash of the content of the input file and of the parameters of the stage that produced
+    them, so a renamed or copied recording still hits the cache, and an edited one does not. Each entry is a directory
+    of .npy files that are memory mapped when read back. The least recently used entries are removed when the cache
+    grows beyond `max_bytes`, and an entry larger than that, e.g. the full rate arrays of a recording of hours, is not
+    stored at all.
+
+    Usage example:
+         cache = AnalysisCache()
+         key = cache.key("baseline", file=cache.file_digest(signal_path), window=1000)
+         arrays = cache.get(key)
+         if arrays is None:
+             arrays = {"y1": compute_baseline(...)}
+             cache.put(key, arrays)
+    """
+
+    def __init__(self, directory: str | Path | None = None, max_bytes: int = 4 * 1024**3):
+        self.directory = Path(directory) if directory else Path.home() / ".cache" / "signal_analyzer"
+        self.max_bytes = max_bytes
+        (self.directory / "entries").mkdir(parents=True, exist_ok=True)
+        (self.directory / "digests").mkdir(parents=True, exist_ok=True)
+
+    def file_digest(self, path: str | Path) -> str:
+        """Return the BLAKE2 digest of the file content.
+
+        Hashing a large recording takes a while, so the digest is remembered for the file's path, size and
+        modification time.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        memo = self.directory / "digests" / self.key(str(path), stat.st_size, stat.st_mtime_ns)
+        if memo.exists():
+            return memo.read_text()
+        digest = hashlib.blake2b(digest_size=20)
+        with path.open("rb") as signal_file:
+            while block := signal_file.read(16 * 1024 * 1024):
+                digest.update(block)
+        memo.write_text(digest.hexdigest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(*parts, **parameters) -> str:
+        text = json.dumps([parts, parameters], sort_keys=True, default=str)
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        entry = self.directory / "entries" / key
+        if not entry.is_dir():
+            return None
+        try:
+            arrays = {path.stem: np.load(path, mmap_mode="r") for path in entry.glob("*.npy")}
+        except (OSError, ValueError):
+            # A damaged or half-removed entry is a cache miss.
+            return None
+        # The modification time of the entry records its last use for the LRU eviction.
+        os.utime(entry)
+        return arrays
+
+    def put(self, key: str, arrays: dict[str, np.ndarray]):
+        if sum(np.asarray(array).nbytes for array in arrays.values()) > self.max_bytes:
+            # It would be written only to be evicted again right away
+            return
+        entries = self.directory / "entries"
+        # Write into a temporary directory and rename it into place, so that readers never see a partial entry.
+        staging = Path(tempfile.mkdtemp(dir=entries, prefix=".staging-"))
+        try:
+            for name, array in arrays.items():
+                np.save(staging / f"{name}.npy", np.asarray(array))
+            os.replace(staging, entries / key)
+        except OSError:
+            # Another process stored the same entry first.
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for entry in (self.directory / "entries").iterdir():
+            if entry.name.startswith(".staging-"):
+                continue
+            try:
+                size = sum(path.stat().st_size for path in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory / "entries", ignore_errors=True)
+        (self.directory / "entries").mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,73 @@
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from idp2023_example.instrumentation import Instrumentation, measure
+
+# Stages of SignalAnalyzer.start and their share of the progress bar, roughly their share of the run time.
+STAGE_WEIGHTS = {
+    "load": 30,
+    "baseline": 25,
+    "downsample": 10,
+    "detect": 25,
+    "classify": 2,
+    "export": 8,
+}
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside the analysis when it has been stopped, to unwind from whatever stage is running."""
+
+
+class StageProgress:
+    """Turn the progress of the analysis stages into one 0-100 percentage and check for cancellation.
+
+    Every stage reports the fraction of its own work that is done. The overall percentage is emitted through `emit`
+    only when it changes, and `is_running` is checked on every report, so a stage that reports after each block of
+    work stops within one block when the analysis is cancelled.
+
+    Usage example:
+         progress = StageProgress(progress_callback.emit, lambda: self.running)
+         with progress.stage("baseline"):
+             for i, block in enumerate(blocks):
+                 process(block)
+                 progress.update((i + 1) / len(blocks))
+    """
+
+    def __init__(self, emit: Callable[[int], None] | None = None, is_running: Callable[[], bool] = lambda: True,
+                 weights: dict[str, int] | None = None, instrumentation: Instrumentation | None = None):
+        self.emit = emit
+        self.is_running = is_running
+        self.weights = STAGE_WEIGHTS if weights is None else weights
+        self.total = sum(self.weights.values())
+        self.done = 0
+        self.current = 0
+        self.percent = -1
+        # Measures every stage when set
+        self.instrumentation = instrumentation
+
+    @contextmanager
+    def stage(self, *names: str):
+        """Run one stage, or several stages that are done together, e.g. in a single streaming pass."""
+        self.check()
+        self.current = sum(self.weights[name] for name in names)
+        with measure(self.instrumentation, "+".join(names)):
+            yield self
+        self.done += self.current
+        self.current = 0
+        self._report(self.done)
+
+    def update(self, fraction: float):
+        """Report the fraction of the current stage that is done and stop if the analysis has been cancelled."""
+        self._report(self.done + self.current * min(max(fraction, 0.0), 1.0))
+        self.check()
+
+    def check(self):
+        if not self.is_running():
+            raise AnalysisCancelled()
+
+    def _report(self, done: float):
+        percent = int(100 * done / self.total)
+        if percent != self.percent:
+            self.percent = percent
+            if self.emit:
+                self.emit(percent)
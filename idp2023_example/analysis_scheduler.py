@@ -0,0 +1,149 @@
+from collections.abc import Callable, Hashable
+from functools import partial
+
+from PySide6.QtCore import QObject, QThreadPool, Signal, Slot
+
+from idp2023_example.process_worker import ProcessWorker
+from idp2023_example.worker import Worker
+
+# Where the jobs run: in threads of the pool, or each in a process of its own waited for by a thread of the pool
+BACKENDS = ("thread", "process")
+
+
+class _Job:
+    def __init__(self, key: Hashable, cancel: Callable[[], None] | None):
+        self.key = key
+        self.cancel = cancel
+        self.cancelled = False
+        # Owned by the job rather than the pool, so that it is still there when the job is cancelled after it ran but
+        # before its finished signal was delivered. Released once it can no longer run.
+        self.worker = None
+
+
+class _JobOutput:
+    # Stands in for a signal of the user interface in the worker thread. The emitted values are sent to the scheduler,
+    # which passes them on in the GUI thread only if the job is still the newest one.
+    def __init__(self, forward: Signal, job: _Job, target):
+        self.forward = forward
+        self.job = job
+        self.target = target
+
+    def emit(self, *args):
+        self.forward.emit(self.job, self.target, args)
+
+
+class AnalysisScheduler(QObject):
+    """Run analysis jobs in a thread pool so that only the newest job reaches the user interface.
+
+    Every job has a key, e.g. the signal file and the analysis parameters. Submitting the key of the job that is
+    already pending or running does nothing. Any other key supersedes the earlier jobs: those that have not started are
+    taken out of the pool, and running ones are stopped with their cancel function. At most `max_concurrent` jobs run
+    at once, so a burst of submissions never runs several analyses side by side.
+
+    With `backend="process"` every job runs in a process of its own (see ProcessWorker), so that it does not compete
+    with the user interface for the GIL. The job function and its object are then copies in that process: the values
+    the job emits and returns come back, but changes to its object do not. The backend can be changed between jobs.
+
+    The signals a job emits are passed on in the GUI thread, and only while the job is the newest one and has not been
+    cancelled. Values a superseded job emitted just before it stopped are dropped.
+
+    Usage example:
+         scheduler = AnalysisScheduler()
+         scheduler.progress.connect(progress_bar.setValue)
+
+         # A new analyzer for every job, so that the jobs never share arrays
+         analyzer = SignalAnalyzer(signal_path)
+         scheduler.submit((signal_path, parameters), analyzer.start, analyzer.stop, update_chart=chart_update_data)
+    """
+
+    progress = Signal(int)
+    result = Signal(object)
+    error = Signal(tuple)
+    stats = Signal(object)
+    _forward = Signal(object, object, tuple)
+
+    def __init__(self, max_concurrent: int = 1, backend: str = "thread", parent: QObject | None = None):
+        super().__init__(parent)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        self.backend = backend
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(max_concurrent)
+        self.jobs = []
+        self.current = None
+        # Emitted from the worker threads, delivered in the thread of the scheduler
+        self._forward.connect(self._deliver)
+
+    def submit(self, key: Hashable, fn: Callable, cancel: Callable[[], None] | None = None, **outputs) -> bool:
+        """Run `fn(progress_callback=..., **outputs)` as the newest job. Returns False if the job was already queued.
+
+        `outputs` are the signals the job emits into, e.g. the chart update signals.
+        """
+        if self.current in self.jobs and self.current.key == key and not self.current.cancelled:
+            return False
+        self.cancel()
+
+        job = _Job(key, cancel)
+        outputs = {name: _JobOutput(self._forward, job, target) for name, target in outputs.items()}
+        if self.backend == "process":
+            # The cancel function runs in the process of the job, on the copy of its object.
+            job.worker = ProcessWorker(fn, cancel=cancel, **outputs)
+            job.cancel = job.worker.cancel
+        else:
+            job.worker = Worker(fn, **outputs)
+        job.worker.signals.progress.connect(partial(self._progress, job))
+        job.worker.signals.stats.connect(partial(self._stats, job))
+        job.worker.signals.result.connect(partial(self._result, job))
+        job.worker.signals.error.connect(partial(self._error, job))
+        job.worker.signals.finished.connect(partial(self._finished, job))
+        job.worker.setAutoDelete(False)
+        self.jobs.append(job)
+        self.current = job
+        self.threadpool.start(job.worker)
+        return True
+
+    def cancel(self):
+        """Cancel all jobs. Pending jobs never start, and running jobs are asked to stop."""
+        if not self.jobs:
+            return
+        running = []
+        for job in self.jobs:
+            job.cancelled = True
+            if self.threadpool.tryTake(job.worker):
+                # The job never started, so it will not emit finished either.
+                job.worker = None
+                continue
+            if job.cancel:
+                job.cancel()
+            running.append(job)
+        self.jobs = running
+        self.progress.emit(0)
+
+    def is_current(self, job: _Job) -> bool:
+        return job is self.current and not job.cancelled
+
+    @Slot(object, object, tuple)
+    def _deliver(self, job: _Job, target, args: tuple):
+        if self.is_current(job):
+            target.emit(*args)
+
+    def _progress(self, job: _Job, value: int):
+        if self.is_current(job):
+            self.progress.emit(value)
+
+    def _stats(self, job: _Job, stats):
+        if self.is_current(job):
+            self.stats.emit(stats)
+
+    def _result(self, job: _Job, result):
+        if self.is_current(job):
+            self.result.emit(result)
+
+    def _error(self, job: _Job, error: tuple):
+        if self.is_current(job):
+            self.error.emit(error)
+
+    def _finished(self, job: _Job):
+        job.worker = None
+        if job in self.jobs:
+            self.jobs.remove(job)
@@ -0,0 +1,94 @@
+from typing import Callable, NamedTuple
+
+import numpy as np
+from scipy import sparse
+from scipy.ndimage import median_filter
+from scipy.sparse.linalg import spsolve
+
+
+def moving_average(y: np.ndarray, window_size: int) -> np.ndarray:
+    """Centered moving average of `y`, O(N) regardless of the window size.
+
+    Reproduces np.convolve(y, np.ones(window_size) / window_size, mode="same"): the samples outside the signal are
+    treated as zeros, so the baseline dips towards the ends of the signal. The window sums are taken from a cumulative
+    sum, which is exact for the integer ADC samples. The result is then independent of where the signal is cut into
+    windows, and float input differs from the convolution only by rounding.
+
+    A 2-D `y` holds one channel per column; all channels are averaged in the same pass.
+    """
+    left = window_size // 2
+    right = window_size - 1 - left
+    cumulative = np.empty((len(y) + 1,) + y.shape[1:], dtype=np.int64 if np.issubdtype(y.dtype, np.integer)
+                          else np.float64)
+    cumulative[0] = 0
+    np.cumsum(y, axis=0, out=cumulative[1:])
+    # window_sum[i] = cumulative[min(i + right + 1, n)] - cumulative[max(i - left, 0)], taken as slices so that the
+    # rows of every channel are copied together. cumulative[0] is zero, so nothing is subtracted from the first rows.
+    n = len(y)
+    inside = max(n - right, 0)
+    window_sum = np.empty_like(cumulative[1:])
+    window_sum[:inside] = cumulative[right + 1:right + 1 + inside]
+    window_sum[inside:] = cumulative[n]
+    window_sum[left:] -= cumulative[:max(n - left, 0)]
+    return window_sum / window_size
+
+
+def running_median(y: np.ndarray, window_size: int) -> np.ndarray:
+    """Centered running median of `y`, O(N log w) for a window of w samples.
+
+    Unlike the moving average, the median is not pulled up by the peaks themselves. The ends of the signal are padded
+    with the first and last sample instead of zeros. A 2-D `y` holds one channel per column.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if y.ndim == 2:
+        # Each channel separately: median_filter is much faster on 1-D input than with a 2-D footprint.
+        return np.column_stack([running_median(channel, window_size) for channel in y.T])
+    return median_filter(y, size=window_size, mode="nearest")
+
+
+def asymmetric_least_squares(
+    y: np.ndarray, window_size: int, smoothness: float = 1e5, asymmetry: float = 0.01, iterations: int = 10
+) -> np.ndarray:
+    """Asymmetric least squares baseline (Eilers & Boelens 2005) fitted on block averages of `y`.
+
+    The signal is decimated by `window_size` before fitting, so the cost is O(N) for the decimation and interpolation
+    plus O(iterations * N / w) for the banded sparse solves. The fit is global, so it cannot be used in streaming mode.
+    A 2-D `y` holds one channel per column, each fitted separately.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if y.ndim == 2:
+        return np.column_stack(
+            [asymmetric_least_squares(channel, window_size, smoothness, asymmetry, iterations) for channel in y.T]
+        )
+    blocks = len(y) // window_size
+    if blocks < 3:
+        return np.full(len(y), y.mean() if len(y) else 0.0)
+    y_decimated = y[:blocks * window_size].reshape(blocks, window_size).mean(axis=1)
+    x_decimated = np.arange(blocks) * window_size + (window_size - 1) / 2
+
+    difference = sparse.diags([1.0, -2.0, 1.0], [0, 1, 2], shape=(blocks - 2, blocks))
+    penalty = smoothness * (difference.T @ difference)
+    weights = np.ones(blocks)
+    for _ in range(iterations):
+        baseline = spsolve((sparse.diags(weights) + penalty).tocsc(), weights * y_decimated)
+        weights = np.where(y_decimated > baseline, asymmetry, 1 - asymmetry)
+    return np.interp(np.arange(len(y)), x_decimated, baseline)
+
+
+class BaselineEstimator(NamedTuple):
+    function: Callable[[np.ndarray, int], np.ndarray]
+    # Number of samples before and after a sample its baseline depends on, or None if the estimator is global.
+    # Streaming analysis needs a finite context.
+    context: Callable[[int], tuple[int, int]] | None
+    cost: str
+
+
+BASELINE_ESTIMATORS: dict[str, BaselineEstimator] = {
+    "moving_average": BaselineEstimator(
+        moving_average, lambda window_size: (window_size // 2, (window_size - 1) // 2), "O(N)"
+    ),
+    "running_median": BaselineEstimator(
+        running_median, lambda window_size: (window_size // 2, (window_size - 1) // 2), "O(N log w)"
+    ),
+    "asymmetric_least_squares": BaselineEstimator(asymmetric_least_squares, None, "O(N) + O(iterations * N / w)"),
+}
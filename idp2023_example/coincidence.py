@@ -0,0 +1,47 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+class Coincidences(NamedTuple):
+    # Indices of the matched peaks into the sensor 1 and sensor 2 peak arrays, and the time from each sensor 1 peak
+    # to its sensor 2 peak.
+    sensor1: np.ndarray
+    sensor2: np.ndarray
+    delays: np.ndarray
+
+
+def _nearest(times: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    # Index of the nearest target of every time; targets must be sorted and non-empty.
+    if len(targets) == 1:
+        return np.zeros(len(times), dtype=np.int64)
+    right = np.clip(np.searchsorted(targets, times), 1, len(targets) - 1)
+    left = right - 1
+    return np.where(np.abs(times - targets[left]) <= np.abs(targets[right] - times), left, right)
+
+
+def match_coincident_peaks(
+    times1: np.ndarray, times2: np.ndarray, tolerance: float, offset: float = 0.0
+) -> Coincidences:
+    """Pair sensor 1 and sensor 2 peaks that are at most `tolerance` apart in time.
+
+    `offset` is the expected delay of sensor 2 after sensor 1. Peaks are paired when each is the nearest peak of the
+    other, so every peak belongs to at most one pair. Both time arrays must be sorted, as peak times are. The search is
+    two binary searches, O((n + m) log(n + m)) for n and m peaks.
+
+    Usage example:
+         pairs = match_coincident_peaks(peak_times_y1, peak_times_y2, tolerance=0.001)
+         confirmed = np.zeros(len(peak_times_y1), dtype=bool)
+         confirmed[pairs.sensor1] = True
+    """
+    times1 = np.asarray(times1, dtype=np.float64)
+    times2 = np.asarray(times2, dtype=np.float64) - offset
+    if len(times1) == 0 or len(times2) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return Coincidences(empty, empty, np.empty(0))
+    sensor1 = np.arange(len(times1))
+    sensor2 = _nearest(times1, times2)
+    nearest1 = _nearest(times2, times1)
+    delays = times2[sensor2] - times1
+    mutual = (nearest1[sensor2] == sensor1) & (np.abs(delays) <= tolerance)
+    return Coincidences(sensor1[mutual], sensor2[mutual], delays[mutual] + offset)
@@ -0,0 +1,214 @@
+import io
+import os
+from collections.abc import Callable, Sequence
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from idp2023_example.process_pool import pool_context
+
+# Bytes of CSV text parsed by one task. The parsed rows of a task are a fraction of this, so the memory in use besides
+# the result stays at a few times this per worker.
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+
+# Part of the progress of read_csv_columns taken by counting the rows, which reads the whole file once more.
+COUNT_SHARE = 0.1
+
+
+def column_indices(header: bytes, columns: Sequence[str]) -> list[int]:
+    """Positions of `columns` in a CSV header line. Files without a recognisable header are assumed to contain the
+    columns in the given order."""
+    names = [name.strip().strip('"') for name in header.decode().split(",")]
+    if all(column in names for column in columns):
+        return [names.index(column) for column in columns]
+    return list(range(len(columns)))
+
+
+def count_rows(block: bytes) -> int:
+    """Number of non-empty lines in a block of CSV text."""
+    text = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(text == ord("\n"))
+    line_lengths = np.diff(line_ends, prepend=-1) - 1
+    carriage_returns = text[np.maximum(line_ends - 1, 0)] == ord("\r")
+    rows = int(np.count_nonzero(line_lengths - carriage_returns > 0))
+    # A last line without a line break
+    tail = block[line_ends[-1] + 1:] if len(line_ends) else block
+    return rows + (1 if tail.strip() else 0)
+
+
+def line_aligned_ranges(path: str | Path, start: int, range_size: int) -> list[tuple[int, int]]:
+    """Split the bytes of the file from `start` on into ranges of about `range_size` that end at line breaks."""
+    size = os.path.getsize(path)
+    boundaries = [start]
+    with open(path, "rb") as csv_file:
+        while boundaries[-1] + range_size < size:
+            csv_file.seek(boundaries[-1] + range_size)
+            # Move the boundary past the next line break
+            position = csv_file.tell()
+            while block := csv_file.read(65536):
+                line_break = block.find(b"\n")
+                if line_break >= 0:
+                    position += line_break + 1
+                    break
+                position += len(block)
+            if position >= size:
+                break
+            boundaries.append(position)
+    boundaries.append(size)
+    return [(begin, end) for begin, end in zip(boundaries[:-1], boundaries[1:]) if end > begin]
+
+
+def sample_rows(
+    path: str | Path, points: int, columns: Sequence[str] = ("adc1", "adc2")
+) -> tuple[np.ndarray, np.ndarray]:
+    """Parse about `points` rows spread evenly over a CSV-file, reading only a few hundred bytes at each.
+
+    Returns the estimated index of every parsed row, from its byte offset and the mean length of the sampled lines,
+    and a (rows, columns) float array of its values. Lines that cannot be parsed are skipped. This gives a quick look
+    at a file long before it has been parsed.
+    """
+    size = os.path.getsize(path)
+    offsets, lengths, values = [], [], []
+    with open(path, "rb") as csv_file:
+        header = csv_file.readline()
+        usecols = column_indices(header, columns)
+        for offset in np.linspace(len(header), size, max(int(points), 1), endpoint=False).astype(np.int64):
+            csv_file.seek(offset)
+            block = csv_file.read(512)
+            begin = 0
+            if offset > len(header):
+                # Skip the rest of the line the offset fell into
+                begin = block.find(b"\n") + 1
+                if begin == 0:
+                    continue
+            end = block.find(b"\n", begin)
+            # Lines longer than the block, and lines already parsed for an earlier offset of a short file
+            if end < 0 or offsets and offsets[-1] == offset + begin:
+                continue
+            fields = block[begin:end].split(b",")
+            try:
+                values.append([float(fields[column]) for column in usecols])
+            except (ValueError, IndexError):
+                continue
+            offsets.append(int(offset) + begin)
+            lengths.append(end - begin + 1)
+    if not values:
+        return np.empty(0), np.empty((0, len(columns)))
+    rows = (np.asarray(offsets) - len(header)) / np.mean(lengths)
+    return rows, np.asarray(values)
+
+
+def _read_range(path: str | Path, start: int, stop: int) -> bytes:
+    with open(path, "rb") as csv_file:
+        csv_file.seek(start)
+        return csv_file.read(stop - start)
+
+
+def _count_range(path: str | Path, start: int, stop: int) -> int:
+    # Runs in a pool process
+    return count_rows(_read_range(path, start, stop))
+
+
+def _parse_range(
+    path: str | Path, start: int, stop: int, usecols: list[int], fields: int, dtype: np.dtype
+) -> np.ndarray:
+    # Runs in a pool process. Only the wanted columns are converted, straight into the target dtype.
+    block = _read_range(path, start, stop)
+    if dtype.kind in "iu" and usecols == list(range(fields)):
+        # A file of just the wanted integer columns is read as one flat sequence of numbers, several times faster than
+        # loadtxt. Anything else, like empty lines or values out of the range of the dtype, is left to loadtxt.
+        try:
+            values = np.fromstring(block.replace(b"\n", b","), dtype=np.int64, sep=",")
+        except ValueError:
+            values = None
+        limits = np.iinfo(dtype)
+        if values is not None and len(values) % fields == 0 and (
+            len(values) == 0 or limits.min <= values.min() and values.max() <= limits.max
+        ):
+            return values.astype(dtype).reshape(-1, fields)
+    return np.loadtxt(io.BytesIO(block), delimiter=",", usecols=usecols, dtype=dtype, ndmin=2, encoding=None)
+
+
+def read_csv_columns(
+    path: str | Path,
+    columns: Sequence[str] = ("adc1", "adc2"),
+    dtype=np.int16,
+    workers: int | None = None,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    progress: Callable[[float], None] | None = None,
+) -> np.ndarray:
+    """Read `columns` of a CSV-file into one (rows, columns) array of `dtype`, in parallel for large files.
+
+    The file is split into byte ranges that end at line breaks. The rows of every range are counted first, so that the
+    result can be allocated once, and then the ranges are parsed in a pool of `workers` processes and copied into
+    their place as they finish. At most two ranges per worker are parsed ahead, which bounds the memory used besides
+    the result to a few range sizes regardless of the size of the file. Files of one range, or `workers=1`, are
+    parsed range by range in this process.
+
+    `progress` is called with the fraction of the work done, the counting being the first COUNT_SHARE of it, after every
+    range counted or parsed and every 0.2 s while waiting for one. An exception raised by it cancels the remaining
+    ranges and is passed on to the caller.
+
+    Usage example:
+         data = read_csv_columns("recording.csv", ("adc1", "adc2"), np.int16, workers=4)
+    """
+    dtype = np.dtype(dtype)
+    with open(path, "rb") as csv_file:
+        header = csv_file.readline()
+    usecols = column_indices(header, columns)
+    fields = header.count(b",") + 1
+    ranges = line_aligned_ranges(path, len(header), range_size)
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+
+    def report(counted, parsed):
+        if progress:
+            progress(COUNT_SHARE * counted / len(ranges) + (1 - COUNT_SHARE) * parsed / len(ranges))
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) if workers > 1 else None
+    try:
+        counts = [0] * len(ranges)
+        if executor is None:
+            for index, (start, stop) in enumerate(ranges):
+                counts[index] = _count_range(path, start, stop)
+                report(index + 1, 0)
+        else:
+            pending = {
+                executor.submit(_count_range, path, start, stop): index for index, (start, stop) in enumerate(ranges)
+            }
+            while pending:
+                finished, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    counts[pending.pop(future)] = future.result()
+                report(len(ranges) - len(pending), 0)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        data = np.empty((int(offsets[-1]), len(columns)), dtype=dtype)
+
+        def place(index, rows):
+            if len(rows) != counts[index]:
+                raise ValueError(f"Malformed lines in bytes {ranges[index][0]}-{ranges[index][1]} of '{path}'")
+            data[offsets[index]:offsets[index + 1]] = rows
+
+        if executor is None:
+            for index, (start, stop) in enumerate(ranges):
+                place(index, _parse_range(path, start, stop, usecols, fields, dtype))
+                report(len(ranges), index + 1)
+            return data
+
+        # Keep at most two ranges per worker in flight, and place the parsed ones as they finish.
+        pending = {}
+        done = 0
+        for index, (start, stop) in enumerate(ranges):
+            pending[executor.submit(_parse_range, path, start, stop, usecols, fields, dtype)] = index
+            while len(pending) >= 2 * workers or (pending and index == len(ranges) - 1):
+                finished, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    place(pending.pop(future), future.result())
+                    done += 1
+                report(len(ranges), done)
+    except BaseException:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return data
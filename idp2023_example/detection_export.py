@@ -0,0 +1,124 @@
+from pathlib import Path
+
+import numpy as np
+
+# Label codes of the detection intervals
+LABELS = ("water", "tissue")
+INTERVAL_DTYPE = np.dtype([("start", np.float64), ("end", np.float64), ("label", np.int8)])
+
+
+def run_length_encode(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the first index, the last index and the value of every run of equal values in a boolean mask."""
+    if len(mask) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    changes = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes - 1, [len(mask) - 1]))
+    return starts, ends, mask[starts]
+
+
+def detection_intervals(time_array: np.ndarray, peaks: np.ndarray) -> np.ndarray:
+    """Split the time axis into tissue intervals at the peaks and water intervals between them."""
+    mask = np.zeros(len(time_array), dtype=bool)
+    mask[peaks] = True
+    starts, ends, is_tissue = run_length_encode(mask)
+    intervals = np.empty(len(starts), dtype=INTERVAL_DTYPE)
+    intervals["start"] = time_array[starts]
+    intervals["end"] = time_array[ends]
+    intervals["label"] = is_tissue
+    return intervals
+
+
+def _fixed_point(values: np.ndarray, decimals: int) -> tuple[np.ndarray, np.ndarray]:
+    # Format non-negative numbers like "{:.5f}" into a matrix of ASCII characters, one row per number, and a mask of
+    # the characters that are part of the number (leading zeros of the integer part are masked out).
+    scaled = values * 10**decimals
+    rounded = np.round(scaled)
+    # np.round breaks ties to even and the product is rounded itself, so numbers within a few ulps of a tie are
+    # formatted by Python, which rounds the exact decimal value of the double.
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.spacing(scaled))
+    rounded[ties] = [int(f"{value:.{decimals}f}".replace(".", "")) for value in values[ties]]
+    scaled = rounded.astype(np.int64)
+    width = max(len(str(int(scaled.max()))) if len(scaled) else 1, decimals + 1)
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (scaled[:, None] // powers % 10 + ord("0")).astype(np.uint8)
+    integer_width = width - decimals
+    integer_digits = digits[:, :integer_width]
+    nonzero = integer_digits != ord("0")
+    first = np.where(nonzero.any(axis=1), nonzero.argmax(axis=1), integer_width - 1)
+
+    chars = np.concatenate(
+        (integer_digits, np.full((len(values), 1), ord("."), dtype=np.uint8), digits[:, integer_width:]), axis=1
+    )
+    keep = np.ones(chars.shape, dtype=bool)
+    keep[:, :integer_width] = np.arange(integer_width) >= first[:, None]
+    return chars, keep
+
+
+def _column(text: str, rows: int) -> tuple[np.ndarray, np.ndarray]:
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    return np.broadcast_to(chars, (rows, len(chars))), np.ones((rows, len(chars)), dtype=bool)
+
+
+def write_detections_csv(path: str | Path, intervals: np.ndarray, batch_size: int = 1 << 20):
+    """Write the intervals as startTime,endTime,label rows with five decimals.
+
+    The rows are formatted in batches as whole character matrices, so no Python code runs per row.
+    """
+    names_width = max(len(name) for name in LABELS)
+    label_chars = np.zeros((len(LABELS), names_width), dtype=np.uint8)
+    label_keep = np.zeros((len(LABELS), names_width), dtype=bool)
+    for code, name in enumerate(LABELS):
+        label_chars[code, :len(name)] = np.frombuffer(name.encode(), dtype=np.uint8)
+        label_keep[code, :len(name)] = True
+
+    with open(path, "wb") as detections_file:
+        detections_file.write(b"startTime,endTime,label\n")
+        for offset in range(0, len(intervals), batch_size):
+            batch = intervals[offset:offset + batch_size]
+            rows = len(batch)
+            columns = [
+                _fixed_point(batch["start"], 5),
+                _column(",", rows),
+                _fixed_point(batch["end"], 5),
+                _column(",", rows),
+                (label_chars[batch["label"]], label_keep[batch["label"]]),
+                _column("\n", rows),
+            ]
+            chars = np.concatenate([chars for chars, _ in columns], axis=1)
+            keep = np.concatenate([keep for _, keep in columns], axis=1)
+            detections_file.write(chars[keep].tobytes())
+
+
+def write_detections_npy(path: str | Path, intervals: np.ndarray):
+    """Save the intervals as a structured .npy array with start, end and label code (index to LABELS) fields."""
+    np.save(path, intervals)
+
+
+def peak_intervals(peaks: np.ndarray, length: int, sample_rate: float) -> np.ndarray:
+    """Same intervals as detection_intervals(np.arange(length) / sample_rate, peaks), without the time axis.
+
+    Only the peaks are looked at, so the cost does not grow with the length of the signal. Live analysis uses this,
+    as it keeps only the newest seconds of the full rate signal, and so does the full rate export, which then needs no
+    time axis.
+    """
+    peaks = np.unique(np.asarray(peaks, dtype=np.int64))
+    # Runs of consecutive peak samples are tissue, the samples between the runs water.
+    gaps = np.diff(peaks) > 1
+    tissue_starts = peaks[np.concatenate(([True], gaps))] if len(peaks) else peaks
+    tissue_ends = peaks[np.concatenate((gaps, [True]))] if len(peaks) else peaks
+    water_starts = np.concatenate(([0], tissue_ends + 1))
+    water_ends = np.concatenate((tissue_starts - 1, [length - 1]))
+    non_empty = water_starts <= water_ends
+
+    starts = np.concatenate((tissue_starts, water_starts[non_empty]))
+    ends = np.concatenate((tissue_ends, water_ends[non_empty]))
+    labels = np.concatenate(
+        (np.ones(len(tissue_starts), dtype=np.int8), np.zeros(np.count_nonzero(non_empty), dtype=np.int8))
+    )
+    order = np.argsort(starts, kind="stable")
+    intervals = np.empty(len(starts), dtype=INTERVAL_DTYPE)
+    intervals["start"] = starts[order] / sample_rate
+    intervals["end"] = ends[order] / sample_rate
+    intervals["label"] = labels[order]
+    return intervals
@@ -0,0 +1,27 @@
+from collections.abc import Callable
+from typing import Protocol
+
+
+class Emitter(Protocol):
+    """Where the analysis sends its progress, statistics and chart data.
+
+    The analysis only calls `emit`, so it runs without Qt: the GUI passes Qt signals, which are emitters as they
+    are, and other callers pass a CallbackEmitter or any object with an `emit` method.
+    """
+
+    def emit(self, *args):
+        ...
+
+
+class CallbackEmitter:
+    """Emitter that calls a plain function, for running the analysis without Qt.
+
+    Usage example:
+         analyzer.start(progress_callback=CallbackEmitter(lambda percent: print(f"{percent} %")))
+    """
+
+    def __init__(self, callback: Callable[..., None]):
+        self.callback = callback
+
+    def emit(self, *args):
+        self.callback(*args)
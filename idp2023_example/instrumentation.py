@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import NamedTuple
+
+
+class StageStats(NamedTuple):
+    # Start time in seconds from the creation of the Instrumentation, wall and CPU time of the stage in seconds, and
+    # the peak number of bytes allocated during the stage on top of what was allocated when it started.
+    name: str
+    start: float
+    wall: float
+    cpu: float
+    peak_bytes: int
+    thread: int
+
+
+class Instrumentation:
+    """Record the wall time, CPU time and peak allocation of named stages.
+
+    The CPU time is that of the measuring thread, so work done in other processes, like the workers of the full rate
+    peak detection, shows up as wall time only. Peak allocations are measured with tracemalloc, which is started on
+    the first measured stage when `trace_memory` is set; it slows down code that allocates many small Python objects,
+    so leave it off when only the times matter. Every finished stage is passed to `emit`, e.g. a WorkerSignals.stats
+    signal's emit, and kept in `stages` for `write_chrome_trace`.
+
+    Instrumentation is opt-in: the analyzer and the converter measure their stages only when their `instrumentation`
+    attribute is set, and otherwise only pay for one `if` per stage.
+
+    Usage example:
+         analyzer.instrumentation = Instrumentation()
+         analyzer.start()
+         for stage in analyzer.instrumentation.stages:
+             print(stage.name, stage.wall, stage.cpu, stage.peak_bytes)
+         analyzer.instrumentation.write_chrome_trace("trace.json")  # open in https://ui.perfetto.dev
+    """
+
+    def __init__(self, emit: Callable[[StageStats], None] | None = None, trace_memory: bool = True):
+        self.emit = emit
+        self.trace_memory = trace_memory
+        self.stages: list[StageStats] = []
+        self.origin = time.perf_counter()
+        self._started_tracing = False
+
+    @contextmanager
+    def measure(self, name: str):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu_start
+            peak = tracemalloc.get_traced_memory()[1] - allocated if self.trace_memory else 0
+            stats = StageStats(name, start - self.origin, wall, cpu, max(peak, 0), threading.get_native_id())
+            self.stages.append(stats)
+            if self.emit:
+                self.emit(stats)
+
+    def mark(self, name: str, since: float):
+        """Record the time from `since`, a time.perf_counter() value, until now as a stage, e.g. a latency that spans
+        several stages. No CPU time or allocation is measured for it."""
+        now = time.perf_counter()
+        stats = StageStats(name, since - self.origin, now - since, 0.0, 0, threading.get_native_id())
+        self.stages.append(stats)
+        if self.emit:
+            self.emit(stats)
+
+    def totals(self) -> dict[str, StageStats]:
+        """Sum the times of stages that ran several times, e.g. once per block, keeping the largest peak."""
+        totals = {}
+        for stats in self.stages:
+            total = totals.get(stats.name)
+            if total is not None:
+                stats = total._replace(wall=total.wall + stats.wall, cpu=total.cpu + stats.cpu,
+                                       peak_bytes=max(total.peak_bytes, stats.peak_bytes))
+            totals[stats.name] = stats
+        return totals
+
+    def write_chrome_trace(self, path: str | Path):
+        """Write the stages in the Chrome trace event format, which chrome://tracing and Perfetto can open."""
+        events = [
+            {
+                "name": stats.name,
+                "ph": "X",
+                "ts": stats.start * 1e6,
+                "dur": stats.wall * 1e6,
+                "pid": os.getpid(),
+                "tid": stats.thread,
+                "args": {"cpu_ms": stats.cpu * 1e3, "peak_bytes": stats.peak_bytes},
+            }
+            for stats in self.stages
+        ]
+        Path(path).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+    def close(self):
+        """Stop tracemalloc if the instrumentation started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+class PaintTimes:
+    """Seconds from the start of an analysis until it first sent data to the chart, and until it sent the final peaks.
+
+    The chart outputs of the analysis are wrapped with `track`, which notes the first emit, and the analysis calls
+    `final` once its final results have been emitted. With an Instrumentation both times are also recorded as the
+    stages "time_to_first_paint" and "time_to_final", which the stage statistics and the Chrome trace show.
+
+    Usage example:
+         paint_times = PaintTimes(instrumentation)
+         update_chart = paint_times.track(update_chart)
+         ...
+         paint_times.final()
+         print(paint_times.first_paint, paint_times.final_paint)
+    """
+
+    def __init__(self, instrumentation: Instrumentation | None = None):
+        self.instrumentation = instrumentation
+        self.started = time.perf_counter()
+        self.first_paint: float | None = None
+        self.final_paint: float | None = None
+
+    def track(self, emitter):
+        """The emitter with the time of its first emit noted, or None for None."""
+        return None if emitter is None else _PaintTracker(self, emitter)
+
+    def painted(self):
+        if self.first_paint is None:
+            self.first_paint = time.perf_counter() - self.started
+            if self.instrumentation:
+                self.instrumentation.mark("time_to_first_paint", self.started)
+
+    def final(self):
+        if self.first_paint is not None:
+            self.final_paint = time.perf_counter() - self.started
+            if self.instrumentation:
+                self.instrumentation.mark("time_to_final", self.started)
+
+
+class _PaintTracker:
+    def __init__(self, paint_times: PaintTimes, emitter):
+        self.paint_times = paint_times
+        self.emitter = emitter
+
+    def emit(self, *args):
+        self.emitter.emit(*args)
+        self.paint_times.painted()
+
+
+def measure(instrumentation: Instrumentation | None, name: str):
+    """Measure a stage with the instrumentation, or do nothing when it is None."""
+    return instrumentation.measure(name) if instrumentation is not None else nullcontext()
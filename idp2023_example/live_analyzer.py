@@ -0,0 +1,441 @@
+"""Live analysis of a signal while it is being acquired.
+
+Usage example:
+     signal_live recording.csv --seconds 30                 # replay a recording at 50 kHz and report the latency
+     signal_live recording.npy --speed 4 --latency-target 0.25
+
+Samples are read from a `SampleSource` block by block. Each block is baseline corrected as soon as the samples its
+baseline depends on have arrived, and peaks are detected in segments that end at a quiet point of both sensors, so
+every peak is reported once and never revised. The chart and the peak counts are updated at most every
+`chart_interval` seconds. The latency of a peak is the time from the acquisition of its sample until its count is
+emitted; the run meets its target when the 99th percentile of the latency is within `latency_target`, no samples were
+dropped, and the processing kept up with the signal.
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+import numpy as np
+from scipy.signal import find_peaks, peak_prominences
+
+from idp2023_example.baseline_estimators import BASELINE_ESTIMATORS
+from idp2023_example.coincidence import match_coincident_peaks
+from idp2023_example.detection_export import peak_intervals, write_detections_csv
+from idp2023_example.peak_store import PeakStore
+from idp2023_example.signal_analyzer import DEFAULT_SAMPLE_RATE, SignalAnalyzer
+from idp2023_example.signal_container import read_header
+
+
+class SampleSource(Protocol):
+    """Anything live samples can be read from, e.g. the measurement device or a replayed recording."""
+
+    sample_rate: int
+
+    def read(self, max_rows: int) -> np.ndarray | None:
+        """Wait for new samples and return at most `max_rows` of them as (rows, 2) adc1/adc2, None at the end."""
+
+    def close(self):
+        """Release the device or file."""
+
+
+class ReplaySource:
+    """Play a recorded signal file back at its sample rate, as if it was being acquired.
+
+    The samples become available in blocks of `block_seconds`, like the packets of the measurement device, and wait
+    in a FIFO of `fifo_seconds` until they are read. Samples that overflow the FIFO because the reader fell behind are
+    dropped and counted in `dropped`. The sample rate is taken from the header of a signal container file unless it is
+    given. `speed` plays the file faster than real time, and `duration` plays only its first
+    seconds. The file is loaded on the first read, so a source can be created in the GUI thread and read from a
+    worker.
+
+    Usage example:
+         source = ReplaySource("recording.csv")
+         while (block := source.read(5000)) is not None:
+             process(block)
+    """
+
+    def __init__(self, path: str | Path, sample_rate: int | None = None, speed: float = 1.0,
+                 block_seconds: float = 0.01, fifo_seconds: float = 1.0, duration: float | None = None):
+        self.path = path
+        if sample_rate is None:
+            header = read_header(path)
+            sample_rate = header["sample_rate"] if header else DEFAULT_SAMPLE_RATE
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.block_size = max(int(block_seconds * sample_rate), 1)
+        self.fifo_size = max(int(fifo_seconds * sample_rate), self.block_size)
+        self.duration = duration
+        self.data = None
+        self.position = 0
+        self.started = None
+        self.dropped = 0
+
+    def __len__(self):
+        self._load()
+        return len(self.data)
+
+    def _load(self):
+        if self.data is None:
+            # The loaders of the analyzer handle the CSV, .npy and raw binary files alike.
+            analyzer = SignalAnalyzer(self.path, sample_rate=self.sample_rate)
+            analyzer.load_data()
+            if analyzer.data is None:
+                raise ValueError(f"Could not load '{self.path}'")
+            self.data = analyzer.data
+            if self.duration is not None:
+                self.data = self.data[:int(self.duration * self.sample_rate)]
+
+    def _available(self, now: float) -> int:
+        # Samples acquired by `now`, in whole blocks
+        acquired = int((now - self.started) * self.sample_rate * self.speed)
+        return min(acquired // self.block_size * self.block_size, len(self.data))
+
+    def read(self, max_rows: int) -> np.ndarray | None:
+        self._load()
+        if self.position >= len(self.data):
+            return None
+        if self.started is None:
+            self.started = time.perf_counter()
+        available = self._available(time.perf_counter())
+        if available <= self.position:
+            # Sleep until the next block has been acquired
+            due = (self.position // self.block_size + 1) * self.block_size
+            time.sleep(max(self.started + due / (self.sample_rate * self.speed) - time.perf_counter(), 0.0))
+            available = max(self._available(time.perf_counter()), min(due, len(self.data)))
+        if available - self.position > self.fifo_size:
+            self.dropped += available - self.fifo_size - self.position
+            self.position = available - self.fifo_size
+        stop = min(available, self.position + max_rows)
+        block = np.array(self.data[self.position:stop])
+        self.position = stop
+        return block
+
+    def close(self):
+        self.data = None
+
+
+class RingBuffer:
+    """The newest `capacity` rows of one or more arrays, written in place into the arrays given.
+
+    Rows are addressed by their position in the whole stream; `total` rows have been appended so far, and the rows
+    from `oldest` on are still in the buffer.
+
+    Usage example:
+         ring = RingBuffer(np.zeros(n), np.zeros(n))
+         ring.append(x_block, y_block)
+         x, y = ring.get(ring.oldest, ring.total)
+    """
+
+    def __init__(self, *arrays: np.ndarray):
+        self.arrays = arrays
+        self.capacity = len(arrays[0])
+        self.total = 0
+
+    @property
+    def oldest(self) -> int:
+        return max(self.total - self.capacity, 0)
+
+    def append(self, *blocks: np.ndarray):
+        rows = len(blocks[0])
+        if rows > self.capacity:
+            self.total += rows - self.capacity
+            blocks = [block[-self.capacity:] for block in blocks]
+            rows = self.capacity
+        start = self.total % self.capacity
+        first = min(rows, self.capacity - start)
+        for array, block in zip(self.arrays, blocks):
+            array[start:start + first] = block[:first]
+            array[:rows - first] = block[first:]
+        self.total += rows
+
+    def get(self, start: int, stop: int) -> list[np.ndarray]:
+        """Rows [start, stop) of every array in order; views when the rows do not wrap around, copies otherwise."""
+        if start < self.oldest or stop > self.total or start > stop:
+            raise IndexError(f"Rows {start}-{stop} are not in the buffer ({self.oldest}-{self.total})")
+        begin = start % self.capacity
+        end = begin + stop - start
+        if end <= self.capacity:
+            return [array[begin:end] for array in self.arrays]
+        return [np.concatenate((array[begin:], array[:end - self.capacity])) for array in self.arrays]
+
+
+class LiveStats(NamedTuple):
+    seconds: float  # of signal analysed
+    peaks: int
+    latency_median: float
+    latency_p99: float
+    latency_max: float
+    # Share of the wall time spent processing; at 1 or above the analysis cannot keep up with the signal
+    load: float
+    dropped: int
+    latency_target: float
+
+    @property
+    def meets_target(self) -> bool:
+        return self.latency_p99 <= self.latency_target and self.dropped == 0 and self.load < 1.0
+
+
+class LiveAnalyzer:
+    """Baseline removal, peak detection and classification of a live signal, block by block.
+
+    The settings come from `analyzer`: the baseline estimator and window, the peak height and prominence relative to
+    the highest sample, the peak distance of full rate detection, the peak classes and the coincidence requirement.
+    Its 10 s `x_array`, `y1_array` and `y2_array` hold the newest corrected samples as a ring buffer, which is what
+    the chart shows. Unlike in the offline analysis, the highest sample is the highest seen so far, and the prominence
+    of a peak is measured within `wlen` samples (20 ms), as the signal after it is not known yet. Peaks of the first
+    `warmup_seconds` are reported only after it, once the level of the signal is known, and are left out of the
+    latency statistics.
+
+    The corrected samples are exactly those of the offline analysis. The baseline of a sample needs half a baseline
+    window of later samples, and a peak its `wlen // 2` following samples and a quiet stretch after it, so a peak is
+    ready about 30 ms after it was acquired with the default settings; the throttled chart update adds up to
+    `chart_interval`.
+
+    Usage example:
+         live = LiveAnalyzer(ReplaySource("recording.csv"), SignalAnalyzer("recording.csv", require_coincidence=True))
+         worker = Worker(live.start, update_chart=..., update_chart_peaks=..., update_peak_counts=...)
+         ...
+         live.stop()
+    """
+
+    def __init__(self, source: SampleSource, analyzer: SignalAnalyzer | None = None, chart_interval: float = 0.1,
+                 latency_target: float = 0.25, warmup_seconds: float = 1.0, max_segment_seconds: float = 0.5):
+        self.source = source
+        self.analyzer = analyzer or SignalAnalyzer(getattr(source, "path", None), sample_rate=source.sample_rate)
+        if self.analyzer.sample_rate != source.sample_rate:
+            raise ValueError("The analyzer and the source must have the same sample rate")
+        context = BASELINE_ESTIMATORS[self.analyzer.baseline_method].context
+        if context is None:
+            raise ValueError(f"Baseline method '{self.analyzer.baseline_method}' cannot be used in live mode")
+        self.running = False
+        self.sample_rate = source.sample_rate
+        # Samples acquired per second of wall time, higher than the sample rate when a recording is replayed faster
+        self.acquisition_rate = self.sample_rate * getattr(source, "speed", 1.0)
+        self.chart_interval = chart_interval
+        self.latency_target = latency_target
+        self.context = context(self.analyzer.baseline_window)
+        self.wlen = self.sample_rate // 50
+        self.distance = self.analyzer.full_rate_peak_distance
+        self.tolerance = max(self.analyzer.coincidence_tolerance, 1 / self.sample_rate)
+        # A segment ends in the middle of 2 * half_gap samples where both sensors are below the peak height. No peak
+        # is closer than half_gap to the cut, so neither the distance selection nor the coincidence of a peak
+        # depends on the next segment.
+        self.half_gap = max(-(-self.distance // 2), int(np.ceil(self.tolerance * self.sample_rate / 2))) + 1
+        self.warmup = int(warmup_seconds * self.sample_rate)
+        self.max_segment = int(max_segment_seconds * self.sample_rate)
+        # Rows read from the source at a time; the raw samples only need to outlive their baseline context.
+        self.max_rows = self.sample_rate // 10
+        self.raw_capacity = sum(self.context) + self.max_rows + 1
+        if len(self.analyzer.x_array) < 2 * (self.max_segment + self.wlen + self.max_rows):
+            raise ValueError("The window of the analyzer is too short for live analysis")
+
+    def stop(self):
+        self.running = False
+
+    def start(self,
+              set_chart_axis_y=None,
+              update_chart=None,
+              update_chart_peaks=None,
+              update_peak_counts=None,
+              progress_callback=None,
+              update_chart_pyramid=None) -> LiveStats:
+        # Read and analyse the source until it ends or stop() is called, write the detections and return the
+        # statistics of the run.
+        self.running = True
+        analyzer = self.analyzer
+        analyzer.peak_counter.count_peaks(np.empty(0))
+        if update_chart_pyramid:
+            # The live chart shows the ring buffer, not the pyramid of an earlier offline run.
+            update_chart_pyramid.emit("Sensor 1", None)
+            update_chart_pyramid.emit("Sensor 2", None)
+        self.raw = None
+        self.ring = RingBuffer(analyzer.x_array, analyzer.y1_array, analyzer.y2_array)
+        self.level = np.zeros(2)
+        self.finalized = 0
+        self.first_acquired = None
+        self.peaks = []
+        self.visible_peaks = np.empty((0, 3))
+        self.visible_heights = np.empty(0)
+        self.new_peaks = []
+        self.latencies = []
+        busy = 0.0
+        started = time.perf_counter()
+        last_update = started
+        length = len(self.source) if hasattr(self.source, "__len__") else None
+        try:
+            while self.running:
+                block = self.source.read(self.max_rows)
+                received = time.perf_counter()
+                if block is not None and len(block):
+                    if self.first_acquired is None:
+                        self.first_acquired = received - (len(block) - 1) / self.acquisition_rate
+                    self._append_raw(block)
+                self._process(final=block is None)
+                if block is None or received - last_update >= self.chart_interval:
+                    last_update = time.perf_counter()
+                    self._emit(set_chart_axis_y, update_chart, update_chart_peaks, update_peak_counts)
+                    if progress_callback and length:
+                        progress_callback.emit(int(100 * self.raw.total / length))
+                busy += time.perf_counter() - received
+                if block is None:
+                    break
+        finally:
+            self.running = False
+            self.source.close()
+
+        if self.raw is not None:
+            intervals = peak_intervals(np.concatenate(self.peaks or [np.empty(0, dtype=np.int64)]), self.raw.total,
+                                       self.sample_rate)
+            write_detections_csv(analyzer.output_path, intervals)
+        return self.stats(busy / max(time.perf_counter() - started, 1e-9))
+
+    def stats(self, load: float = 0.0) -> LiveStats:
+        latencies = np.concatenate(self.latencies) if self.latencies else np.zeros(1)
+        return LiveStats(
+            seconds=(self.raw.total if self.raw is not None else 0) / self.sample_rate,
+            peaks=int(sum(len(peaks) for peaks in self.peaks)),
+            latency_median=float(np.median(latencies)),
+            latency_p99=float(np.percentile(latencies, 99)),
+            latency_max=float(latencies.max()),
+            load=load,
+            dropped=int(getattr(self.source, "dropped", 0)),
+            latency_target=self.latency_target,
+        )
+
+    def _append_raw(self, block: np.ndarray):
+        if self.raw is None:
+            self.raw = RingBuffer(np.empty((self.raw_capacity, 2), dtype=block.dtype))
+        self.raw.append(block)
+
+    def _process(self, final: bool):
+        if self.raw is None:
+            return
+        left, right = self.context
+        received = self.raw.total
+        corrected = self.ring.total
+        # Correct the samples whose baseline context has arrived; at the end of the signal, like in the offline
+        # analysis, the samples past the end count as zeros.
+        end = received if final else received - right
+        if end > corrected:
+            context_start = max(corrected - left, 0)
+            (context,) = self.raw.get(context_start, min(end + right, received))
+            y = self.analyzer.baseline_removal(context)[corrected - context_start:end - context_start]
+            self.ring.append(np.arange(corrected, end) / self.sample_rate, y[:, 0], y[:, 1])
+            self.level = np.maximum(self.level, y.max(axis=0))
+
+        # Detect the peaks of the segments that are complete
+        while True:
+            cut = self._next_cut(final)
+            if cut is None:
+                break
+            self._detect_segment(self.finalized, cut)
+            self.finalized = cut
+
+    def _next_cut(self, final: bool) -> int | None:
+        start = self.finalized
+        available = self.ring.total
+        if available <= start or (available < self.warmup and not final):
+            return None
+        if final:
+            return available
+        # The prominence of a peak needs wlen // 2 samples after it.
+        limit = available - self.wlen // 2
+        if limit - start < 2 * self.half_gap:
+            return None
+        _, y1, y2 = self.ring.get(start, limit)
+        heights = self.analyzer.peak_height * self.level
+        quiet = (y1 < heights[0]) & (y2 < heights[1])
+        quiet_count = np.concatenate(([0], np.cumsum(quiet)))
+        runs = np.flatnonzero(quiet_count[2 * self.half_gap:] - quiet_count[:-2 * self.half_gap] == 2 * self.half_gap)
+        if len(runs):
+            return start + int(runs[-1]) + self.half_gap
+        if limit - start >= self.max_segment:
+            # No quiet point for a long time: cut anyway, a peak at the cut may be split or paired wrongly.
+            return limit
+        return None
+
+    def _detect_segment(self, start: int, stop: int):
+        half_window = self.wlen // 2
+        context_start = max(start - half_window, self.ring.oldest)
+        context_stop = min(stop + half_window, self.ring.total)
+        _, *channels = self.ring.get(context_start, context_stop)
+        found = []
+        for channel, y in enumerate(channels):
+            height = self.analyzer.peak_height * self.level[channel]
+            segment = y[start - context_start:stop - context_start]
+            peaks, properties = find_peaks(segment, height=height, distance=self.distance)
+            prominences = peak_prominences(y, peaks + (start - context_start), wlen=self.wlen)[0]
+            keep = prominences >= self.analyzer.peak_prominence * self.level[channel]
+            found.append((peaks[keep] + start, properties["peak_heights"][keep] / max(self.level[channel], 1e-12)))
+        (peaks_y1, heights_y1), (peaks_y2, _) = found
+
+        if self.analyzer.require_coincidence:
+            pairs = match_coincident_peaks(peaks_y1 / self.sample_rate, peaks_y2 / self.sample_rate, self.tolerance)
+            peaks_y1, heights_y1 = peaks_y1[pairs.sensor1], heights_y1[pairs.sensor1]
+        self.analyzer.peak_counter.add_peaks(heights_y1)
+        self.peaks.append(peaks_y1)
+        values = channels[0][peaks_y1 - context_start]
+        self.visible_peaks = np.concatenate(
+            (self.visible_peaks, np.column_stack((peaks_y1 / self.sample_rate, values, heights_y1)))
+        )
+        if stop > self.warmup:
+            self.new_peaks.append(peaks_y1[peaks_y1 >= self.warmup])
+
+    def _emit(self, set_chart_axis_y, update_chart, update_chart_peaks, update_peak_counts):
+        analyzer = self.analyzer
+        if self.ring.total == 0:
+            return
+        x, y1, y2 = self.ring.get(self.ring.oldest, self.ring.total)
+        oldest_time = x[0]
+        self.visible_peaks = self.visible_peaks[self.visible_peaks[:, 0] >= oldest_time]
+        if update_chart and len(x) >= analyzer.num_points:
+            x_downsampled, y_downsampled = analyzer.downsample(x, np.stack((y1, y2)), analyzer.num_points)
+            update_chart.emit("Sensor 1", x_downsampled, y_downsampled[0])
+            update_chart.emit("Sensor 2", x_downsampled, y_downsampled[1])
+            if set_chart_axis_y:
+                set_chart_axis_y.emit(float(y_downsampled.min()), float(y_downsampled.max()))
+        if update_chart_peaks:
+            classes = analyzer.peak_counter.classifier.classify(self.visible_peaks[:, 2])
+            times, values, heights = self.visible_peaks.T
+            update_chart_peaks.emit(
+                "Sensor 1", PeakStore(times, values, heights, codes=classes.codes, names=classes.names)
+            )
+        if update_peak_counts:
+            counter = analyzer.peak_counter
+            update_peak_counts.emit(counter.large_peaks, counter.medium_peaks, counter.small_peaks)
+
+        # The peaks detected since the previous update are now shown
+        emitted = time.perf_counter()
+        for peaks in self.new_peaks:
+            self.latencies.append(emitted - (self.first_acquired + peaks / self.acquisition_rate))
+        self.new_peaks = []
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a recording in live mode and measure the latency.")
+    parser.add_argument("signal", type=Path, help="CSV, .npy or converted binary signal file")
+    parser.add_argument("--sample-rate", type=int, default=None,
+                        help="sample rate of files that do not record it (default 50000)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed relative to real time")
+    parser.add_argument("--seconds", type=float, default=None, help="stop after this many seconds of signal")
+    parser.add_argument("--latency-target", type=float, default=0.25, help="allowed 99th percentile latency in s")
+    parser.add_argument("--require-coincidence", action="store_true")
+    parser.add_argument("-o", "--output", type=Path, default=Path("live_detections.csv"))
+    args = parser.parse_args(argv)
+
+    source = ReplaySource(args.signal, args.sample_rate, speed=args.speed, duration=args.seconds)
+    analyzer = SignalAnalyzer(args.signal, sample_rate=source.sample_rate, output_path=args.output,
+                              require_coincidence=args.require_coincidence)
+    live = LiveAnalyzer(source, analyzer, latency_target=args.latency_target)
+    stats = live.start()
+    print(f"{stats.seconds:.1f} s of signal, {stats.peaks} peaks, {stats.dropped} samples dropped")
+    print(f"Latency median {stats.latency_median * 1e3:.1f} ms, 99 % {stats.latency_p99 * 1e3:.1f} ms, "
+          f"max {stats.latency_max * 1e3:.1f} ms (target {stats.latency_target * 1e3:.0f} ms)")
+    print(f"Processing load {stats.load:.1%} of real time")
+    return 0 if stats.meets_target else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+import os
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor, wait
+from functools import partial
+
+import numpy as np
+from scipy.signal import find_peaks, peak_prominences
+
+from idp2023_example.process_pool import pool_context
+
+# Samples per chunk when no chunk size is given. It does not depend on the number of workers, so neither do the chunk
+# boundaries.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def _quiet_boundary(y: np.ndarray, nominal: int, height: float, half_gap: int, search: int) -> int | None:
+    # Find a cut point near `nominal` that has at least `half_gap` samples below `height` on both sides. No peak can
+    # be closer than that to the cut, so the peaks and the distance selection of the two chunks are independent.
+    lo = max(nominal - search, 1)
+    hi = min(nominal + search, len(y) - 1)
+    if hi - lo < 2 * half_gap:
+        return None
+    quiet = np.concatenate(([0], np.cumsum(np.asarray(y[lo:hi]) < height)))
+    runs = np.flatnonzero(quiet[2 * half_gap:] - quiet[:-2 * half_gap] == 2 * half_gap)
+    if len(runs) == 0:
+        return None
+    # Prefer the quiet run closest to the nominal boundary to keep the chunks evenly sized.
+    best = runs[np.argmin(np.abs(runs + half_gap + lo - nominal))]
+    return int(lo + best + half_gap)
+
+
+class _BlockIndex:
+    # Minimum and maximum of every `size` samples of a signal. Searches for the nearest higher sample and for the
+    # lowest sample of a range look at whole blocks first and only scan the samples of the blocks that matter, so
+    # resolving a peak costs O(N / size + size) instead of O(N).
+
+    def __init__(self, y: np.ndarray, size: int = 4096):
+        self.y = y
+        self.size = size
+        starts = np.arange(0, len(y), size)
+        self.block_max = np.maximum.reduceat(y, starts) if len(y) else np.empty(0)
+        self.block_min = np.minimum.reduceat(y, starts) if len(y) else np.empty(0)
+
+    def _parts(self, start: int, stop: int) -> list[tuple[int, int, bool]]:
+        # Split [start, stop) into (begin, end, is_whole_blocks) parts, in order.
+        first_whole = min(-(-start // self.size) * self.size, stop)
+        last_whole = max(stop // self.size * self.size, first_whole)
+        parts = [(start, first_whole, False), (first_whole, last_whole, True), (last_whole, stop, False)]
+        return [part for part in parts if part[0] < part[1]]
+
+    def _hits(self, begin: int, end: int, whole: bool, match, stats: np.ndarray, last: bool) -> int | None:
+        if whole:
+            blocks = np.flatnonzero(match(stats[begin // self.size:end // self.size]))
+            if not len(blocks):
+                return None
+            block = begin // self.size + blocks[-1 if last else 0]
+            begin, end = block * self.size, (block + 1) * self.size
+        samples = np.flatnonzero(match(self.y[begin:end]))
+        return begin + int(samples[-1 if last else 0]) if len(samples) else None
+
+    def find(self, start: int, stop: int, match, stats: np.ndarray, last: bool) -> int | None:
+        # Position of the first (or last) sample in [start, stop) for which `match` is true.
+        parts = self._parts(start, stop)
+        for begin, end, whole in reversed(parts) if last else parts:
+            position = self._hits(begin, end, whole, match, stats, last)
+            if position is not None:
+                return position
+        return None
+
+    def lowest(self, start: int, stop: int, last: bool) -> int:
+        # Position of the first (or last) occurrence of the minimum of [start, stop).
+        minimum = min(
+            (self.block_min[begin // self.size:end // self.size] if whole else self.y[begin:end]).min()
+            for begin, end, whole in self._parts(start, stop)
+        )
+        return self.find(start, stop, lambda values: values == minimum, self.block_min, last)
+
+    def bases(self, peak: int, reach: int) -> tuple[int, int]:
+        # The bases of `peak` as scipy.signal.peak_prominences finds them: the lowest sample between the peak and the
+        # nearest higher sample (or the end of the window) on each side, the one closest to the peak.
+        height = self.y[peak]
+
+        def higher(values):
+            return values > height
+
+        left_limit = max(peak - reach, 0)
+        right_limit = min(peak + reach, len(self.y) - 1)
+        left_higher = self.find(left_limit, peak, higher, self.block_max, last=True)
+        right_higher = self.find(peak + 1, right_limit + 1, higher, self.block_max, last=False)
+        left_start = left_limit if left_higher is None else left_higher + 1
+        right_stop = right_limit + 1 if right_higher is None else right_higher
+        return self.lowest(left_start, peak + 1, last=True), self.lowest(peak, right_stop, last=False)
+
+
+def _select_by_distance(peaks: np.ndarray, heights: np.ndarray, distance: int, length: int) -> np.ndarray:
+    # Mask of the peaks the distance selection of find_peaks keeps, with equally high peaks ranked by position: the
+    # first one is kept. find_peaks itself leaves that choice to an unstable sort of the heights, so it could differ
+    # between chunkings. The ranks are distinct, so running find_peaks on spikes of the rank height at the peaks makes
+    # the same greedy selection in a fixed order.
+    ranks = np.empty(len(peaks))
+    ranks[np.argsort(-heights, kind="stable")] = np.arange(len(peaks), 0, -1)
+    spikes = np.zeros(length)
+    spikes[peaks] = ranks
+    kept, _ = find_peaks(spikes, distance=distance)
+    keep = np.zeros(len(peaks), dtype=bool)
+    keep[np.searchsorted(peaks, kept)] = True
+    return keep
+
+
+def _chunk_peaks(
+    context: np.ndarray, context_start: int, start: int, stop: int, length: int, height, distance, wlen
+) -> dict[str, np.ndarray]:
+    # Runs in a pool process. Peaks and the distance selection come from the chunk [start, stop) alone, prominences
+    # from the chunk plus its context.
+    chunk = context[start - context_start:stop - context_start]
+    peaks, properties = find_peaks(chunk, height=height)
+    if distance is not None and len(peaks) > 1:
+        keep = _select_by_distance(peaks, properties["peak_heights"], distance, len(chunk))
+        peaks, properties = peaks[keep], {key: value[keep] for key, value in properties.items()}
+    peaks_in_context = peaks + (start - context_start)
+    prominences, left_bases, right_bases = peak_prominences(context, peaks_in_context, wlen=wlen)
+
+    # The prominence of a peak is exact if the search for a higher sample stopped inside the context, reached the
+    # end of the whole signal, or was limited by the window `wlen`. Other peaks are resolved against the full signal.
+    reach = len(context) if wlen is None else int(np.ceil(wlen)) // 2
+    heights = context[peaks_in_context]
+    higher_on_left = np.zeros(len(peaks), dtype=bool)
+    higher_on_right = np.zeros(len(peaks), dtype=bool)
+    if len(peaks):
+        # Maximum of the context before each peak and after each peak, from the maxima of the segments between peaks.
+        before = np.maximum.accumulate(np.maximum.reduceat(context, np.r_[0, peaks_in_context])[:-1])
+        after = np.maximum.accumulate(np.maximum.reduceat(context, peaks_in_context + 1)[::-1])[::-1]
+        higher_on_left = before > heights
+        higher_on_right = after > heights
+    left_resolved = higher_on_left | (context_start == 0) | (peaks_in_context - reach >= 0)
+    right_resolved = (
+        higher_on_right
+        | (context_start + len(context) == length)
+        | (peaks_in_context + reach < len(context))
+    )
+    return {
+        "peaks": peaks + start,
+        "peak_heights": properties["peak_heights"],
+        "prominences": prominences,
+        "left_bases": left_bases + context_start,
+        "right_bases": right_bases + context_start,
+        "unresolved": ~(left_resolved & right_resolved),
+    }
+
+
+def find_peaks_parallel(
+    y: np.ndarray,
+    height: float,
+    prominence: float | None = None,
+    distance: int | None = None,
+    wlen: int | None = None,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+    progress: Callable[[float], None] | None = None,
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Find peaks like scipy.signal.find_peaks, split into chunks that are processed in a process pool.
+
+    Chunks are cut only at quiet points where no sample within `distance` is above `height`, so the peaks and the
+    distance selection of a chunk do not depend on its neighbours. Each chunk is sent to a worker with context on
+    both sides for the prominence calculation: half a chunk, or `wlen // 2` samples when a window length is given.
+    The few peaks whose prominence search runs past the context, typically the highest peaks of a chunk, are resolved
+    against the whole signal afterwards.
+
+    The result equals a single find_peaks call and depends neither on the number of workers nor on `chunk_size`. Of
+    two equally high peaks closer than `distance`, which find_peaks leaves to the sort order, the first one is kept.
+
+    `progress` is called with the fraction of chunks done after each chunk, and every 0.2 s while waiting for one. An
+    exception raised by it cancels the chunks that have not started yet and is passed on to the caller.
+    """
+    prominences = None if prominence is None else [prominence]
+    return find_peaks_parallel_channels(
+        [y], [height], prominences, distance, wlen, workers, chunk_size, progress
+    )[0]
+
+
+def _chunk_tasks(y: np.ndarray, height: float, distance: int | None, wlen: int | None, chunk_size: int) -> list[tuple]:
+    # Cut the signal into chunks at quiet points and return the arguments of _chunk_peaks for every chunk.
+    length = len(y)
+    half_gap = max(-(-(distance or 1) // 2), 1)
+    overlap = chunk_size // 2 if wlen is None else int(wlen) // 2 + 1
+
+    boundaries = [0]
+    for nominal in range(chunk_size, length - chunk_size // 2, chunk_size):
+        boundary = _quiet_boundary(y, nominal, height, half_gap, chunk_size // 4)
+        if boundary is not None and boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    boundaries.append(length)
+
+    tasks = []
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        context_start = max(start - overlap, 0)
+        context_stop = min(stop + overlap, length)
+        tasks.append((np.asarray(y[context_start:context_stop]), context_start, start, stop, length, height))
+    return tasks
+
+
+def _stitch(
+    y: np.ndarray, results: list[dict[str, np.ndarray]], prominence: float | None, wlen: int | None
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    # Join the peaks of the chunks of one signal and resolve the prominences the chunks could not.
+    properties = {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+    peaks = properties.pop("peaks")
+    unresolved = np.flatnonzero(properties.pop("unresolved"))
+    if len(unresolved):
+        block_index = _BlockIndex(np.asarray(y))
+        reach = len(y) if wlen is None else int(np.ceil(wlen)) // 2
+    for index in unresolved:
+        peak = peaks[index]
+        left_base, right_base = block_index.bases(peak, reach)
+        properties["left_bases"][index] = left_base
+        properties["right_bases"][index] = right_base
+        properties["prominences"][index] = y[peak] - max(y[left_base], y[right_base])
+
+    if prominence is not None:
+        keep = properties["prominences"] >= prominence
+        peaks = peaks[keep]
+        properties = {key: value[keep] for key, value in properties.items()}
+    return peaks, properties
+
+
+def find_peaks_parallel_channels(
+    channels: Sequence[np.ndarray],
+    heights: Sequence[float],
+    prominences: Sequence[float] | None = None,
+    distance: int | None = None,
+    wlen: int | None = None,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+    progress: Callable[[float], None] | None = None,
+    on_chunk: Callable[[int, dict[str, np.ndarray]], None] | None = None,
+) -> list[tuple[np.ndarray, dict[str, np.ndarray]]]:
+    """Run find_peaks_parallel on several signals, e.g. the two sensors of a recording, in one process pool.
+
+    The chunks of all signals are queued together, so the pool is started once and its workers stay busy until the
+    last chunk of the last signal. `heights` and `prominences` hold the thresholds of each signal. Returns the peaks
+    and properties of every signal in order.
+
+    `on_chunk` is called with the index of the signal and the peaks of every chunk as the chunks are collected, in
+    order, e.g. to draw the peaks found so far. Those are the "peaks", "peak_heights" and "prominences" of the chunk,
+    before any prominence threshold; the prominences of peaks marked "unresolved" are lower bounds until the chunks
+    are stitched together.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    plans = [_chunk_tasks(y, height, distance, wlen, chunk_size) for y, height in zip(channels, heights)]
+    tasks = [task for plan in plans for task in plan]
+
+    chunk_peaks = partial(_chunk_peaks, distance=distance, wlen=wlen)
+    channel_of_task = [channel for channel, plan in enumerate(plans) for _ in plan]
+    results = []
+
+    def collected(result):
+        results.append(result)
+        if on_chunk:
+            on_chunk(channel_of_task[len(results) - 1], result)
+        if progress:
+            progress(len(results) / len(tasks))
+
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            collected(chunk_peaks(*task))
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=pool_context())
+        try:
+            futures = [executor.submit(chunk_peaks, *task) for task in tasks]
+            # Collect the results in chunk order, which keeps the stitched result deterministic. While waiting,
+            # progress is called regularly so that the caller can cancel even before the first chunk is done.
+            for future in futures:
+                while progress and not wait([future], timeout=0.2).done:
+                    progress(len(results) / len(tasks))
+                collected(future.result())
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    found = []
+    for channel, (y, plan) in enumerate(zip(channels, plans)):
+        channel_results, results = results[:len(plan)], results[len(plan):]
+        found.append(_stitch(y, channel_results, None if prominences is None else prominences[channel], wlen))
+    return found
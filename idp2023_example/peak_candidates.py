@@ -0,0 +1,92 @@
+import math
+from typing import NamedTuple
+
+import numpy as np
+from scipy.signal import find_peaks
+
+
+def select_by_peak_distance(peaks: np.ndarray, priority: np.ndarray, distance: float) -> np.ndarray:
+    """Mask of the sorted `peaks` that the distance filter of find_peaks keeps, with `priority` as their heights.
+
+    Like find_peaks, the peaks are visited from the highest down, in the order of np.argsort so that equally high
+    peaks are chosen between the same way, and every peak kept removes the peaks closer than `distance` to it. Only
+    peaks with a neighbour that close take part in the loop, which usually leaves a small fraction of them.
+    """
+    distance = math.ceil(distance)
+    keep = np.ones(len(peaks), dtype=bool)
+    close = np.diff(peaks) < distance
+    crowded = np.zeros(len(peaks), dtype=bool)
+    crowded[:-1] |= close
+    crowded[1:] |= close
+    order = np.argsort(priority)
+    for j in order[crowded[order]][::-1].tolist():
+        if not keep[j]:
+            continue
+        k = j - 1
+        while k >= 0 and peaks[j] - peaks[k] < distance:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < len(peaks) and peaks[k] - peaks[j] < distance:
+            keep[k] = False
+            k += 1
+    return keep
+
+
+class PeakCandidates(NamedTuple):
+    """Every peak of a signal above a floor height, with the properties find_peaks filters peaks by.
+
+    `peaks` are sample indices, `heights` and `prominences` are in the units of the signal, and `scale` is the value
+    the relative settings refer to, i.e. the highest sample. find_peaks filters the local maxima of a signal by height,
+    then by distance and last by prominence, and the prominence of a peak does not depend on the other peaks. `select`
+    applies the same three filters in the same order to the table, so it returns exactly the peaks of
+    find_peaks(y, height=height * scale, prominence=prominence * scale, distance=distance) for any height down to
+    `min_height`, in a few milliseconds instead of a pass over the signal.
+
+    Candidates of a long full rate signal can be selected by `distance` already, as the prominences of all its local
+    maxima take long to compute. Filtering those by height is still exact: the distance selection keeps the highest
+    peaks first, so lower peaks never change which higher ones it keeps. Only that distance can be selected then.
+
+    Usage example:
+         candidates = find_candidates(y / y.max(), min_height=0.005)
+         selected = candidates.select(height=0.015, prominence=0.015, distance=2)
+         peaks, heights = candidates.peaks[selected], candidates.relative_heights[selected]
+    """
+
+    peaks: np.ndarray
+    heights: np.ndarray
+    prominences: np.ndarray
+    scale: float
+    min_height: float
+    # Distance the candidates were selected with, or None
+    distance: int | None = None
+
+    @property
+    def relative_heights(self) -> np.ndarray:
+        return self.heights / self.scale
+
+    def select_by_height_and_distance(self, height: float, distance: int | None = None) -> np.ndarray:
+        """Indices of the candidates left after the height and distance filters of find_peaks."""
+        if height < self.min_height:
+            raise ValueError(f"Height {height} is below the {self.min_height} the candidates were detected with")
+        selected = np.flatnonzero(self.heights >= height * self.scale)
+        if self.distance is not None:
+            if distance != self.distance:
+                raise ValueError(
+                    f"Distance {distance} differs from the {self.distance} the candidates were selected with"
+                )
+        elif distance is not None and len(selected):
+            selected = selected[select_by_peak_distance(self.peaks[selected], self.heights[selected], distance)]
+        return selected
+
+    def select(self, height: float, prominence: float, distance: int | None = None) -> np.ndarray:
+        """Indices of the candidates find_peaks returns with these settings, relative to `scale`."""
+        selected = self.select_by_height_and_distance(height, distance)
+        return selected[self.prominences[selected] >= prominence * self.scale]
+
+
+def find_candidates(y: np.ndarray, min_height: float, scale: float | None = None) -> PeakCandidates:
+    """All peaks of `y` at least `min_height * scale` high, with their prominences. `scale` defaults to max(y)."""
+    scale = float(np.max(y)) if scale is None else scale
+    peaks, properties = find_peaks(y, height=min_height * scale, prominence=0)
+    return PeakCandidates(peaks, properties["peak_heights"], properties["prominences"], scale, min_height)
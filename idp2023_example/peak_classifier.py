@@ -0,0 +1,62 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+DEFAULT_NAMES = ("Small peaks", "Medium peaks", "Large peaks")
+
+
+class PeakClasses(NamedTuple):
+    # Class code of every peak, the number of peaks in each class, the indices of the peaks of each class, and the
+    # names of the classes.
+    codes: np.ndarray
+    counts: np.ndarray
+    indices: list[np.ndarray]
+    names: tuple[str, ...]
+
+
+class PeakClassifier:
+    """Bin peaks into classes by their normalized height.
+
+    Class i holds the peaks with edges[i - 1] < height <= edges[i]; the first class has no lower edge and the last no
+    upper edge. With the default edges (0.1, 0.3) the classes are small, medium and large peaks. All peaks are binned
+    in one vectorized pass.
+
+    Usage example:
+         classifier = PeakClassifier()
+         classes = classifier.classify(peak_heights)
+         large_peak_heights = peak_heights[classes.indices[2]]
+
+         # Peaks arriving from a stream are added to the running counts
+         classifier.update(new_peak_heights)
+         print(classifier.counts)
+    """
+
+    def __init__(self, edges=(0.1, 0.3), names=None):
+        if names is None:
+            names = DEFAULT_NAMES if len(edges) == 2 else tuple(f"Class {i + 1} peaks" for i in range(len(edges) + 1))
+        if len(names) != len(edges) + 1:
+            raise ValueError("There must be one more class name than class edges")
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.names = tuple(names)
+        self.counts = np.zeros(len(self.names), dtype=np.int64)
+
+    def codes(self, heights: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.edges, heights, side="left")
+
+    def classify(self, heights: np.ndarray) -> PeakClasses:
+        codes = self.codes(heights)
+        counts = np.bincount(codes, minlength=len(self.names))
+        # A stable sort groups the peaks by class and keeps them in time order within each class.
+        order = np.argsort(codes, kind="stable")
+        indices = np.split(order, np.cumsum(counts)[:-1])
+        return PeakClasses(codes, counts, indices, self.names)
+
+    def update(self, heights: np.ndarray) -> PeakClasses:
+        """Classify new peaks and add them to the running counts."""
+        classes = self.classify(heights)
+        self.counts += classes.counts
+        return classes
+
+    def reset(self):
+        self.counts[:] = 0
@@ -1,10 +1,24 @@
+import numpy as np
+
+from idp2023_example.peak_classifier import PeakClassifier, PeakClasses
+
+
 class PeakCounter:
-    def __init__(self):
+    def __init__(self, classifier=None):
+        self.classifier = classifier or PeakClassifier()
         self.large_peaks = 0
         self.medium_peaks = 0
         self.small_peaks = 0
 
-    def count_peaks(self, peak_heights):
-        self.large_peaks = sum(1 for height in peak_heights if height > 0.3)
-        self.medium_peaks = sum(1 for height in peak_heights if 0.1 < height <= 0.3)
-        self.small_peaks = sum(1 for height in peak_heights if height <= 0.1)
\ No newline at end of file
+    def count_peaks(self, peak_heights) -> PeakClasses:
+        self.classifier.reset()
+        return self.add_peaks(peak_heights)
+
+    def add_peaks(self, peak_heights) -> PeakClasses:
+        classes = self.classifier.update(np.asarray(peak_heights))
+        # The lowest class holds the small peaks, the highest the large ones, and any classes in between medium ones.
+        counts = self.classifier.counts
+        self.small_peaks = int(counts[0])
+        self.large_peaks = int(counts[-1]) if len(counts) > 1 else 0
+        self.medium_peaks = int(counts[1:-1].sum())
+        return classes
@@ -0,0 +1,69 @@
+from PySide6.QtCore import Qt, Signal, Slot
+from PySide6.QtWidgets import QFormLayout, QHBoxLayout, QLabel, QSlider, QWidget
+
+
+class PeakSettingsWidget(QWidget):
+    """Sliders for the peak height, prominence and distance and the edges of the peak classes.
+
+    `settings_changed` is emitted with the changed settings as keyword arguments of SignalAnalyzer.set_peak_settings
+    on every step of a slider while it is dragged, and `settings()` returns all of them. Heights, prominences and
+    edges are shown in percent of the highest sample, the distance in samples of the downsampled signal.
+
+    Usage example:
+         peak_settings = PeakSettingsWidget()
+         peak_settings.settings_changed.connect(lambda settings: analyzer.reclassify(**settings))
+    """
+
+    settings_changed = Signal(dict)
+
+    # Name, label, minimum, maximum and initial value of the sliders, with the initial values of SignalAnalyzer.
+    # Percentages are in steps of 0.1 %; the lowest height is the candidate height of SignalAnalyzer.
+    SLIDERS = (
+        ("peak_height", "Height", 5, 200, 15),
+        ("peak_prominence", "Prominence", 0, 200, 15),
+        ("peak_distance", "Distance", 1, 20, 2),
+        ("medium_edge", "Medium above", 1, 999, 100),
+        ("large_edge", "Large above", 1, 999, 300),
+    )
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sliders: dict[str, QSlider] = {}
+        self.value_labels: dict[str, QLabel] = {}
+        layout = QFormLayout(self)
+        for name, label, minimum, maximum, value in self.SLIDERS:
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(minimum, maximum)
+            slider.setValue(value)
+            value_label = QLabel()
+            value_label.setMinimumWidth(50)
+            row = QHBoxLayout()
+            row.addWidget(slider)
+            row.addWidget(value_label)
+            layout.addRow(label, row)
+            self.sliders[name] = slider
+            self.value_labels[name] = value_label
+            self._show_value(name)
+            slider.valueChanged.connect(lambda _, name=name: self._slider_moved(name))
+
+    def _show_value(self, name: str):
+        value = self.sliders[name].value()
+        self.value_labels[name].setText(str(value) if name == "peak_distance" else f"{value / 10:.1f} %")
+
+    def settings(self) -> dict:
+        values = {name: slider.value() for name, slider in self.sliders.items()}
+        # The sliders of the edges may cross, the lower one is the medium edge.
+        edges = sorted((values["medium_edge"] / 1000, values["large_edge"] / 1000))
+        return {
+            "peak_height": values["peak_height"] / 1000,
+            "peak_prominence": values["peak_prominence"] / 1000,
+            "peak_distance": values["peak_distance"],
+            "class_edges": tuple(edges),
+        }
+
+    @Slot()
+    def _slider_moved(self, name: str):
+        self._show_value(name)
+        settings = self.settings()
+        key = "class_edges" if name.endswith("_edge") else name
+        self.settings_changed.emit({key: settings[key]})
@@ -0,0 +1,93 @@
+import numpy as np
+
+from idp2023_example.peak_classifier import DEFAULT_NAMES
+
+
+class PeakStore:
+    """Detected peaks sorted by time, one array per column, for time range queries.
+
+    The columns are the time of every peak in seconds, the amplitude of the corrected signal at the peak, its height
+    and prominence relative to the highest sample, and its class code from PeakClassifier. A time range maps to a
+    slice of the columns by binary search, so a query costs O(log N) plus the size of its answer, and the peaks of a
+    range are views that share the memory of the store. `thinned` keeps at most one peak of each class per pixel for
+    drawing, so the chart draws at most a few thousand markers however many peaks were detected.
+
+    Usage example:
+         store = PeakStore(times, amplitudes, heights, prominences, classes.codes, classes.names)
+         visible = store.between(10.0, 20.0)          # the peaks of 10-20 s
+         counts = store.counts(10.0, 20.0)            # number of peaks of each class in 10-20 s
+         markers = store.thinned(10.0, 20.0, 1200)    # the highest peak of each class in every one of 1200 pixels
+    """
+
+    def __init__(self, times, amplitudes, heights, prominences=None, codes=None, names=DEFAULT_NAMES):
+        times = np.asarray(times, dtype=np.float64)
+        columns = {
+            "times": times,
+            "amplitudes": np.asarray(amplitudes, dtype=np.float64),
+            "heights": np.asarray(heights, dtype=np.float64),
+            "prominences": np.full(len(times), np.nan) if prominences is None else np.asarray(prominences,
+                                                                                             dtype=np.float64),
+            "codes": np.zeros(len(times), dtype=np.int8) if codes is None else np.asarray(codes, dtype=np.int8),
+        }
+        if any(len(column) != len(times) for column in columns.values()):
+            raise ValueError("All peak columns must have the same length")
+        if np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind="stable")
+            columns = {name: column[order] for name, column in columns.items()}
+        self.times = columns["times"]
+        self.amplitudes = columns["amplitudes"]
+        self.heights = columns["heights"]
+        self.prominences = columns["prominences"]
+        self.codes = columns["codes"]
+        self.names = tuple(names)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _take(self, index) -> "PeakStore":
+        # A store of the rows `index` of this one; slices are views.
+        store = PeakStore.__new__(PeakStore)
+        store.times = self.times[index]
+        store.amplitudes = self.amplitudes[index]
+        store.heights = self.heights[index]
+        store.prominences = self.prominences[index]
+        store.codes = self.codes[index]
+        store.names = self.names
+        return store
+
+    def span(self, start: float = -np.inf, stop: float = np.inf) -> slice:
+        """Slice of the peaks with start <= time <= stop."""
+        return slice(int(np.searchsorted(self.times, start, side="left")),
+                     int(np.searchsorted(self.times, stop, side="right")))
+
+    def between(self, start: float = -np.inf, stop: float = np.inf) -> "PeakStore":
+        return self._take(self.span(start, stop))
+
+    def counts(self, start: float = -np.inf, stop: float = np.inf) -> np.ndarray:
+        """Number of peaks of each class with start <= time <= stop."""
+        return np.bincount(self.codes[self.span(start, stop)], minlength=len(self.names))
+
+    def class_peaks(self, code: int) -> "PeakStore":
+        return self._take(np.flatnonzero(self.codes == code))
+
+    def thinned(self, start: float, stop: float, pixels: int) -> "PeakStore":
+        """The peaks of the time range drawn `pixels` wide, keeping only the highest peak of each class per pixel.
+
+        Ranges with at most `pixels` peaks are returned whole.
+        """
+        visible = self.between(start, stop)
+        pixels = max(int(pixels), 1)
+        if len(visible) <= pixels or stop <= start:
+            return visible
+        column = np.minimum(((visible.times - start) * (pixels / (stop - start))).astype(np.int64), pixels - 1)
+        bucket = column * len(self.names) + visible.codes
+        # Group the peaks by bucket. The buckets are almost sorted already, as the times are, which the stable sort
+        # takes advantage of. Then keep the first peak of every group that has the highest amplitude of the group.
+        order = np.argsort(bucket, kind="stable")
+        amplitudes = visible.amplitudes[order]
+        new_group = np.concatenate(([True], np.diff(bucket[order]) != 0))
+        group = np.cumsum(new_group) - 1
+        highest = np.maximum.reduceat(amplitudes, np.flatnonzero(new_group))
+        candidates = np.flatnonzero(amplitudes == highest[group])
+        first = np.concatenate(([True], np.diff(group[candidates]) != 0))
+        return visible._take(np.sort(order[candidates[first]]))
@@ -0,0 +1,222 @@
+import io
+import pickle
+import sys
+import threading
+import traceback
+from collections.abc import Callable
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from idp2023_example.process_pool import pool_context
+
+# Arrays of at least this many bytes are passed through shared memory, smaller ones are cheaper to pickle.
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+
+class SharedArray(np.ndarray):
+    """Array whose memory is a shared memory block received from a ProcessJob.
+
+    The block stays mapped as long as the array or any view of it is alive, so these arrays are used like any other.
+    """
+
+    def __array_finalize__(self, obj):
+        # Views keep the block of the array they look into, arrays computed from it do not.
+        block = getattr(obj, "shared_memory", None)
+        self.shared_memory = block if block is not None and np.may_share_memory(self, obj) else None
+
+
+def _attach(name: str, shape: tuple, dtype: np.dtype) -> SharedArray:
+    # Unpickling side of a shared array. The name of the block is removed right away; the memory itself is released
+    # when the last array that maps it is gone.
+    block = shared_memory.SharedMemory(name=name)
+    block.unlink()
+    array = SharedArray(shape, dtype, buffer=block.buf)
+    array.shared_memory = block
+    return array
+
+
+def _view(base: SharedArray, offset: int, shape: tuple, strides: tuple, dtype: np.dtype) -> SharedArray:
+    view = SharedArray(shape, dtype, buffer=base, offset=offset, strides=strides)
+    view.shared_memory = base.shared_memory
+    return view
+
+
+def _root(array: np.ndarray) -> np.ndarray:
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+class _SharingPickler(pickle.Pickler):
+    # Pickles large arrays as the names of shared memory blocks that hold a copy of them. A view that covers at least
+    # half of its base is pickled as a view of the shared base, so e.g. the rows of a 2-D array still share it after
+    # the transfer. The blocks created are appended to `blocks`, which the sender keeps open until the receiver has
+    # mapped them.
+
+    def __init__(self, file, blocks: list):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks = blocks
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < SHARED_MEMORY_THRESHOLD:
+            return NotImplemented
+        root = _root(obj)
+        if root is not obj and 2 * obj.nbytes >= root.nbytes and root.flags.c_contiguous:
+            offset = obj.__array_interface__["data"][0] - root.__array_interface__["data"][0]
+            return _view, (root, offset, obj.shape, obj.strides, obj.dtype)
+        block = shared_memory.SharedMemory(create=True, size=obj.nbytes)
+        self.blocks.append(block)
+        np.ndarray(obj.shape, obj.dtype, buffer=block.buf)[...] = obj
+        return _attach, (block.name, obj.shape, obj.dtype)
+
+
+def _send(connection, message: tuple, blocks: list, lock: threading.Lock):
+    sent = len(blocks)
+    buffer = io.BytesIO()
+    try:
+        _SharingPickler(buffer, blocks).dump(message)
+    except BaseException:
+        # The receiver never learns the names of these blocks
+        for block in blocks[sent:]:
+            block.close()
+            block.unlink()
+        del blocks[sent:]
+        raise
+    with lock:
+        connection.send_bytes(buffer.getbuffer())
+
+
+class _PipeEmitter:
+    # Stands in for an emitter of the parent process in the job process.
+    def __init__(self, connection, name: str, blocks: list, lock: threading.Lock):
+        self.connection = connection
+        self.name = name
+        self.blocks = blocks
+        self.lock = lock
+
+    def emit(self, *args):
+        _send(self.connection, ("emit", self.name, args), self.blocks, self.lock)
+
+
+def _run(connection, fn: Callable, args: tuple, kwargs: dict, emitter_names: list[str], cancel: Callable | None):
+    # Entry point of the job process.
+    blocks = []
+    lock = threading.Lock()
+    released = threading.Event()
+
+    def listen():
+        # Requests of the parent: cancel the job, or release the blocks once it has mapped all of them.
+        try:
+            while (request := connection.recv_bytes()) != b"release":
+                if request == b"cancel" and cancel:
+                    cancel()
+        except (EOFError, OSError):
+            pass
+        released.set()
+
+    threading.Thread(target=listen, daemon=True).start()
+    kwargs.update({name: _PipeEmitter(connection, name, blocks, lock) for name in emitter_names})
+    try:
+        message = ("result", fn(*args, **kwargs))
+    except BaseException:
+        traceback.print_exc()
+        exctype, value = sys.exc_info()[:2]
+        message = ("error", exctype, value, traceback.format_exc())
+    try:
+        _send(connection, message, blocks, lock)
+    except Exception:
+        # The result or the exception could not be pickled
+        traceback.print_exc()
+        error = RuntimeError(f"Could not return the {message[0]} of the job: {sys.exc_info()[1]}")
+        _send(connection, ("error", RuntimeError, error, traceback.format_exc()), blocks, lock)
+    released.wait()
+    for block in blocks:
+        block.close()
+
+
+class ProcessJob:
+    """Run a function in a separate process, passing what it emits and returns back through shared memory.
+
+    Keyword arguments with an `emit` method, e.g. Qt signals or CallbackEmitters, stay in this process: the function
+    gets stand-ins, and `run` calls the original emitters with what the function emitted. Everything else, the
+    function included, is pickled into the job process, so a bound method runs on a copy of its object. Arrays of at
+    least SHARED_MEMORY_THRESHOLD bytes in the emitted values and the return value are copied once into shared memory
+    in the job process and mapped here as SharedArrays, so even large results cost no copy or pickling on this side.
+
+    `cancel` is called in the job process when `cancel()` is called here, e.g. the `stop` method of the object whose
+    `start` method is the function. As `fn` and `cancel` are pickled together, both refer to the same copy.
+
+    Usage example:
+         analyzer = SignalAnalyzer(signal_path)
+         job = ProcessJob(analyzer.start, cancel=analyzer.stop, progress_callback=CallbackEmitter(print))
+         finished = job.run()
+    """
+
+    def __init__(self, fn: Callable, *args, cancel: Callable | None = None, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.cancel_fn = cancel
+        self.emitters = {name: value for name, value in kwargs.items() if hasattr(value, "emit")}
+        self.kwargs = {name: value for name, value in kwargs.items() if name not in self.emitters}
+        # Traceback of the exception raised in the job process, if any
+        self.remote_traceback = None
+        self.cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _request(self, request: bytes):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.send_bytes(request)
+                except OSError:
+                    # The job process has already exited
+                    pass
+
+    def cancel(self):
+        """Ask the job to stop. Before the process has started, it is asked as soon as it starts."""
+        self.cancelled = True
+        self._request(b"cancel")
+
+    def run(self):
+        """Run the job and wait for it, calling the emitters as it emits. Returns the return value of the function
+        and raises the exception it raised."""
+        context = pool_context()
+        connection, child_connection = context.Pipe()
+        process = context.Process(
+            target=_run,
+            args=(child_connection, self.fn, self.args, self.kwargs, list(self.emitters), self.cancel_fn),
+        )
+        process.start()
+        child_connection.close()
+        with self._lock:
+            self._connection = connection
+        if self.cancelled:
+            self._request(b"cancel")
+
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, *message = pickle.loads(connection.recv_bytes())
+                except EOFError:
+                    process.join()
+                    raise ChildProcessError(f"The job process exited with code {process.exitcode}") from None
+                if kind == "emit":
+                    name, args = message
+                    self.emitters[name].emit(*args)
+                    continue
+                finished = True
+                if kind == "result":
+                    return message[0]
+                _, value, self.remote_traceback = message
+                raise value
+        finally:
+            self._request(b"release")
+            if not finished and process.is_alive():
+                process.terminate()
+            process.join()
+            with self._lock:
+                self._connection = None
+                connection.close()
@@ -0,0 +1,17 @@
+import multiprocessing
+
+# Modules the fork server imports once, so that every pool process forked from it starts with them loaded.
+PRELOAD = ["idp2023_example.parallel_peaks", "idp2023_example.csv_ingest"]
+
+
+def pool_context() -> multiprocessing.context.BaseContext:
+    """Multiprocessing context for the process pools of the analysis.
+
+    Forking a process that runs Qt threads is not safe. A fork server is started from a clean interpreter once and
+    forks the pool processes from there with the PRELOAD modules already imported; platforms without it spawn instead.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD)
+    return context
@@ -0,0 +1,60 @@
+import inspect
+import sys
+import traceback
+
+from PySide6.QtCore import QRunnable, Slot
+
+from idp2023_example.process_job import ProcessJob
+from idp2023_example.worker_signals import WorkerSignals
+
+
+class ProcessWorker(QRunnable):
+    """Worker that runs the runner function in a separate process.
+
+    ProcessWorker emits the same progress, stats, result, error and finished signals as Worker and passes the runner
+    function the same callbacks, but the function runs in a process of its own (see process_job.py). Its Python code
+    then does not hold the GIL of the GUI, so the window stays responsive while e.g. a CSV-file is parsed or the
+    results are exported. The thread of the pool only waits for the process and emits what it sends.
+
+    The function, its object if it is a bound method, and the arguments that are not signals are pickled into the
+    process, so the function works on a copy of its object. Results come back the same way, with large numpy arrays
+    mapped from shared memory instead of being pickled. `cancel` is called in the process by `cancel()`.
+
+    If the function raises an exception, the error signal passes its type, value and the traceback printed in the
+    process. If the process dies, the error is a ChildProcessError.
+
+    Usage example:
+         converter = SignalConverter()
+         worker = ProcessWorker(converter.start, source_signal_path=source, target_signal_path=target,
+                                cancel=converter.cancel)
+         worker.signals.progress.connect(progress.setValue)
+         progress.canceled.connect(worker.cancel)
+         QThreadPool.globalInstance().start(worker)
+    """
+
+    def __init__(self, fn, *args, cancel=None, **kwargs):
+        super().__init__()
+        self.signals = WorkerSignals()
+
+        kwargs["progress_callback"] = self.signals.progress
+        if "stats_callback" in inspect.signature(fn).parameters:
+            kwargs["stats_callback"] = self.signals.stats
+        self.job = ProcessJob(fn, *args, cancel=cancel, **kwargs)
+
+    def cancel(self):
+        self.job.cancel()
+
+    @Slot()
+    def run(self):
+        try:
+            result = self.job.run()
+        except:
+            # Exceptions of the function itself were printed in the process already
+            if self.job.remote_traceback is None:
+                traceback.print_exc()
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, self.job.remote_traceback or traceback.format_exc()))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
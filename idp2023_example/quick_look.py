@@ -0,0 +1,95 @@
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+from idp2023_example.csv_ingest import sample_rows
+from idp2023_example.peak_classifier import PeakClassifier
+from idp2023_example.peak_store import PeakStore
+
+# Points of the coarsest quick look. Every refinement has REFINEMENT_FACTOR times as many.
+FIRST_POINTS = 256
+REFINEMENT_FACTOR = 4
+
+
+def refinement_points(points: int) -> list[int]:
+    """Numbers of points of the successive quick looks, coarsest first and ending with `points`."""
+    counts = [max(int(points), 1)]
+    while counts[-1] // REFINEMENT_FACTOR >= FIRST_POINTS:
+        counts.append(counts[-1] // REFINEMENT_FACTOR)
+    return counts[::-1]
+
+
+def strided_quick_look(data: np.ndarray, sample_rate: float, points: int) -> tuple[np.ndarray, np.ndarray]:
+    """Every n-th row of the (rows, channels) `data`, about `points` of them, and their times.
+
+    Of a memory mapped file only the pages of these rows are read, so this takes milliseconds however long the
+    recording is. Peaks between the rows are missed; the quick look only shows the shape of the recording.
+    """
+    stride = max(len(data) // max(int(points), 1), 1)
+    rows = np.asarray(data[::stride], dtype=np.float64)
+    return np.arange(len(rows)) * stride / sample_rate, rows
+
+
+def csv_quick_look(path: str | Path, sample_rate: float, points: int) -> tuple[np.ndarray, np.ndarray]:
+    """About `points` rows spread over a CSV-file that has not been parsed yet, and their estimated times."""
+    rows, values = sample_rows(path, points)
+    return rows / sample_rate, values
+
+
+class ProvisionalPeaks:
+    """Peaks of the chunks of the full rate detection that have finished, for drawing while the rest is running.
+
+    `add` is the `on_chunk` of find_peaks_parallel_channels. It keeps the peaks of the signal `channel` that pass
+    `height` and `prominence`, relative to `scale`. The prominences of a chunk are lower bounds for the few peaks
+    whose search ran past its context, so the provisional peaks are the final ones or a few less, and the final peaks
+    only add markers. A PeakStore of all peaks so far is passed to `emit` at most every `interval` seconds, and by
+    `flush`.
+
+    Usage example:
+         provisional = ProvisionalPeaks(y1, sample_rate, y1.max(), 0.015, 0.015, classifier,
+                                        lambda store: update_chart_peaks.emit("Sensor 1", store))
+         find_peaks_parallel_channels([y1, y2], heights, on_chunk=provisional.add)
+         provisional.flush()
+    """
+
+    def __init__(self, y: np.ndarray, sample_rate: float, scale: float, height: float, prominence: float,
+                 classifier: PeakClassifier, emit: Callable[[PeakStore], None], channel: int = 0,
+                 interval: float = 0.1):
+        self.y = y
+        self.sample_rate = sample_rate
+        self.scale = scale
+        self.height = height
+        self.prominence = prominence
+        self.classifier = classifier
+        self.emit = emit
+        self.channel = channel
+        self.interval = interval
+        self.chunks: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.emitted = time.perf_counter()
+        self.pending = False
+
+    def add(self, channel: int, chunk: dict[str, np.ndarray]):
+        if channel != self.channel:
+            return
+        keep = (chunk["peak_heights"] >= self.height * self.scale) & (
+            chunk["prominences"] >= self.prominence * self.scale
+        )
+        self.chunks.append((chunk["peaks"][keep], chunk["peak_heights"][keep], chunk["prominences"][keep]))
+        self.pending = True
+        if time.perf_counter() - self.emitted >= self.interval:
+            self.flush()
+
+    def store(self) -> PeakStore:
+        peaks, heights, prominences = (np.concatenate(column) for column in zip(*self.chunks))
+        heights = heights / self.scale
+        return PeakStore(peaks / self.sample_rate, self.y[peaks], heights, prominences / self.scale,
+                         self.classifier.codes(heights), self.classifier.names)
+
+    def flush(self):
+        """Emit the peaks found so far if any chunk was added since the last emit."""
+        if self.pending:
+            self.emit(self.store())
+            self.emitted = time.perf_counter()
+            self.pending = False
@@ -1,130 +1,685 @@
-import pandas as pd
+from pathlib import Path
+
 import numpy as np
-from PySide6.QtCore import Signal
-from scipy.signal import find_peaks
+from idp2023_example.analysis_progress import AnalysisCancelled, StageProgress
+from idp2023_example.baseline_estimators import BASELINE_ESTIMATORS
+from idp2023_example.detection_export import (
+    detection_intervals,
+    peak_intervals,
+    write_detections_csv,
+    write_detections_npy,
+)
+from idp2023_example.instrumentation import PaintTimes
+from idp2023_example.lod_pyramid import MinMaxPyramid
+from idp2023_example.coincidence import match_coincident_peaks
+from idp2023_example.csv_ingest import count_rows, read_csv_columns
+from idp2023_example.parallel_peaks import find_peaks_parallel_channels
+from idp2023_example.peak_classifier import PeakClassifier
+from idp2023_example.peak_candidates import PeakCandidates, find_candidates
 from idp2023_example.peak_counter import PeakCounter
+from idp2023_example.peak_store import PeakStore
+from idp2023_example.quick_look import ProvisionalPeaks, csv_quick_look, refinement_points, strided_quick_look
+from idp2023_example.signal_container import SignalContainer, read_header
 
-class SignalAnalyzer:
-    update_chart_peaks = Signal(str, np.ndarray, np.ndarray)
+NPY_MAGIC = b"\x93NUMPY"
+# Sample rate of files that do not record it, i.e. CSV, .npy and raw binary files
+DEFAULT_SAMPLE_RATE = 50000
+# Settings of SignalAnalyzer that reclassify can change without detecting the peaks again, besides class_edges
+PEAK_SETTINGS = ("peak_height", "peak_prominence", "peak_distance", "full_rate_peak_distance", "coincidence_tolerance",
+                 "require_coincidence")
 
-    def __init__(self, csv_file_path, sample_rate=50000, duration_seconds=120):
+class SignalAnalyzer:
+    # The analysis does not import Qt, so batch jobs and pool processes start without it. Progress, statistics and
+    # chart data are passed to emitters (see emitter.py): the Qt signals of the GUI, or e.g. a CallbackEmitter.
+    def __init__(self, csv_file_path, sample_rate=None, duration_seconds=120, streaming=False,
+                 baseline_method="moving_average", full_rate=False, workers=None, output_path="detections.csv",
+                 class_edges=(0.1, 0.3), interval_path=None, cache=None, require_coincidence=False, low_memory=False,
+                 progressive=False):
+        if streaming and full_rate:
+            raise ValueError("Full rate peak detection needs the whole signal, it cannot be used in streaming mode")
         self.running = False
         self.csv_file_path = csv_file_path
+        # Signal container files carry their sample rate in the header
+        if sample_rate is None:
+            header = read_header(csv_file_path)
+            sample_rate = header["sample_rate"] if header else DEFAULT_SAMPLE_RATE
         self.sample_rate = sample_rate
         self.duration_seconds = duration_seconds
+        # In streaming mode the signal is processed one window at a time instead of loading the whole recording.
+        self.streaming = streaming
+        # In low-memory mode the corrected signal is kept in float32, computed in place one second at a time, and no
+        # time axis is stored: sample i is at i / sample_rate, and only the times of the downsampled points and the
+        # peaks are computed. Besides the loaded samples (4 bytes per row from a CSV-file, none from a memory mapped
+        # file) the whole-signal arrays then take 24 bytes per row, 8 for y_array and 16 for the chart pyramids,
+        # instead of 40. The temporaries do not grow with the recording: about 5 MiB for the baseline at 50 kHz, plus
+        # those of the peak detection. Estimators without a finite context still compute a float64 baseline of the
+        # whole signal at once.
+        self.low_memory = low_memory
+        # In progressive mode a quick look at the raw signal is drawn while the file is still being loaded: first a
+        # coarse one, then finer ones up to quick_look_points (see quick_look.py). The full rate peak detection also
+        # draws the peaks of the chunks done so far, unless only coincident peaks are counted.
+        self.progressive = progressive
+        self.quick_look_points = 4096
+        # Time to the first and to the final chart update of the last run of start()
+        self.paint_times = None
         self.window_size = sample_rate * 10  # 10 sekuntia dataa
+        self.block_size = sample_rate * 10  # rows read at a time from the signal file
+        self.baseline_window = 1000
+        # Name of the baseline estimator in BASELINE_ESTIMATORS
+        self.baseline_method = baseline_method
+        # Detect peaks at the native sample rate in a process pool instead of on the downsampled signal.
+        self.full_rate = full_rate
+        self.workers = workers
+        self.full_rate_peak_distance = sample_rate // 1000  # 1 ms
+        # find_peaks settings, height and prominence relative to the highest sample
+        self.peak_height = 0.015
+        self.peak_prominence = 0.015
+        self.peak_distance = 2
+        # Peaks are first detected down to this height, or the peak height if that is lower, and then filtered with
+        # the settings above. Other settings down to this height only filter the candidates again (see reclassify).
+        self.min_peak_height = 0.005
+        # Sensor 1 and sensor 2 peaks at most this far apart in seconds (or one downsampled sample) are coincident.
+        self.coincidence_tolerance = 0.001
+        # Count and export only the sensor 1 peaks that sensor 2 confirms
+        self.require_coincidence = require_coincidence
+        self.output_path = output_path
+        # Optional binary copy of the detections for downstream tools
+        self.interval_path = interval_path
+        self.num_points = 5000
         self.x_array = np.zeros((self.window_size,))
         self.y1_array = np.zeros_like(self.x_array)  # Sensor 1 data
         self.y2_array = np.zeros_like(self.x_array)  # Sensor 2 data
+        # Baseline corrected sensor 1 and sensor 2 data of the whole signal as rows; y1_array and y2_array are its rows
+        self.y_array = None
         self.x_array_downsampled = None
         self.y1_array_downsampled = None
+        self.y2_array_downsampled = None
+        self.candidates_y1 = None
+        self.candidates_y2 = None
         self.peaks_y1 = None
-        self.peak_counter = PeakCounter()
+        self.peaks_y2 = None
+        self.coincidences = None
+        # Sensor 1 peaks that are counted, with their times, amplitudes and classes (see peak_store.py)
+        self.peak_store = None
+        self.pyramid_y1 = None
+        self.pyramid_y2 = None
+        self.peak_counter = PeakCounter(PeakClassifier(class_edges))
+        # Optional AnalysisCache for the results of the baseline, downsampling and peak detection stages
+        self.cache = cache
+        self._file_digest = None
+        # Optional Instrumentation that measures the time and memory use of every stage of start()
+        self.instrumentation = None
+        # The signal is loaded by the first stage of start()
+        self.data = None
 
-        self.load_csv_data()
+    def load_data(self, progress=None):
+        self.data = None
+        if Path(self.csv_file_path).suffix == ".csv":
+            if self.streaming:
+                # CSV-files are read in chunks while streaming, nothing is loaded up front.
+                return
+            self.load_csv_data(progress)
+        else:
+            self.load_binary_data()
 
-    def load_csv_data(self):
+    def load_binary_data(self):
+        # Converted files are memory mapped, so opening one does not read the samples from the disk. Signal containers
+        # and files saved with np.save carry their own dtype and shape; raw files written by earlier versions of
+        # SignalConverter are two int16 columns.
         try:
-            df = pd.read_csv(self.csv_file_path)
-            self.data = df[['adc1', 'adc2']].to_numpy()
+            with open(self.csv_file_path, "rb") as signal_file:
+                is_npy = signal_file.read(len(NPY_MAGIC)) == NPY_MAGIC
+            if read_header(self.csv_file_path) is not None:
+                self.data = SignalContainer(self.csv_file_path).data
+            elif is_npy:
+                self.data = np.load(self.csv_file_path, mmap_mode="r")
+            else:
+                self.data = np.memmap(self.csv_file_path, dtype=np.int16, mode="r").reshape(-1, 2)
         except Exception as e:
+            print(f"Error loading binary file: {e}")
+            self.data = None
+
+    def load_csv_data(self, progress=None):
+        # The file is parsed in line-aligned byte ranges by a pool of processes, straight into one preallocated int16
+        # array, reporting progress and checking for a stop request while the ranges are parsed.
+        try:
+            self.data = read_csv_columns(self.csv_file_path, ("adc1", "adc2"), np.int16, workers=self.workers,
+                                         progress=progress.update if progress else None)
+        except (OSError, ValueError, KeyError) as e:
             print(f"Error loading CSV file: {e}")
             self.data = None
 
+    def signal_length(self):
+        if self.data is not None:
+            return len(self.data)
+        # Count the non-empty lines of the CSV-file without parsing them, minus the header line.
+        rows = 0
+        remainder = b""
+        with open(self.csv_file_path, "rb") as signal_file:
+            while block := signal_file.read(16 * 1024 * 1024):
+                block = remainder + block
+                cut = block.rfind(b"\n") + 1
+                block, remainder = block[:cut], block[cut:]
+                rows += count_rows(block)
+        rows += count_rows(remainder)
+        return max(rows - 1, 0)
+
+    def iter_signal_blocks(self, block_size):
+        # Yield consecutive (rows, 2) blocks of adc1/adc2 samples from the memory mapped data or from the CSV-file.
+        if self.data is not None:
+            for start in range(0, len(self.data), block_size):
+                yield self.data[start:start + block_size]
+            return
+        # pandas takes a noticeable part of the start-up time, and only CSV-files need it.
+        import pandas as pd
+
+        for chunk in pd.read_csv(self.csv_file_path, usecols=['adc1', 'adc2'], dtype=np.int16,
+                                 chunksize=block_size):
+            yield chunk[['adc1', 'adc2']].to_numpy()
+
+    def iter_signal_windows(self, stop, window_size):
+        # Yield (start, end, context_start, context) for consecutive windows [start, end) of the signal. The context
+        # holds the raw samples of the window plus the neighbouring samples the moving average baseline needs, so
+        # that every corrected sample of the window is computed from the same input as in a whole-file run.
+        length = self.signal_length()
+        context = BASELINE_ESTIMATORS[self.baseline_method].context
+        if context is None:
+            raise ValueError(f"Baseline method '{self.baseline_method}' cannot be used in streaming mode")
+        left, right = context(self.baseline_window)
+        blocks = self.iter_signal_blocks(self.block_size)
+        buffer = np.empty((0, 2), dtype=np.int16)
+        buffer_start = 0
+        for start in range(0, stop, window_size):
+            end = min(start + window_size, stop)
+            context_start = max(0, start - left)
+            context_end = min(end + right, length)
+            while buffer_start + len(buffer) < context_end:
+                buffer = np.concatenate((buffer, next(blocks)))
+            buffer = buffer[context_start - buffer_start:]
+            buffer_start = context_start
+            yield start, end, context_start, buffer[:context_end - context_start]
+
     def write_result_csv(self):
-        # Make a starting dataframe with all times and their labels
-        labels = np.full_like(self.x_array_downsampled, 'water', dtype=object)
-        labels[self.peaks_y1] = 'tissue'
-        dataframe = pd.DataFrame().from_dict(
-            {'time': self.x_array_downsampled,
-             'label': labels})
-        # Group by label and duration time
-        dataframe['group'] = (dataframe['label'] != dataframe['label'].shift()).cumsum()
-        result = (dataframe.groupby(['group', 'label'])
-                  .agg(startTime=('time', 'first'),
-                       endTime=('time', 'last'))
-                  .reset_index())
-        # Format result dataframe to follow specs given on ELearn
-        result = result.drop(columns='group')
-        result['startTime'] = result['startTime'].apply(lambda x: "{:.5f}".format(x))
-        result['endTime'] = result['endTime'].apply(lambda x: "{:.5f}".format(x))
-        result = result[['startTime', 'endTime', 'label']]
-
-        result.to_csv('detections.csv', index=False)
+        # Peaks are indices to the full rate signal in full rate mode, otherwise to the downsampled one. The times of
+        # the full rate signal are only computed at the interval boundaries.
+        peaks = self.peaks_y1[self._selected_peaks()]
+        # Tissue at the peaks, water between them. Format follows specs given on ELearn.
+        if self.full_rate:
+            intervals = peak_intervals(peaks, len(self.y1_array), self.sample_rate)
+        else:
+            intervals = detection_intervals(self.x_array_downsampled, peaks)
+        write_detections_csv(self.output_path, intervals)
+        if self.interval_path:
+            write_detections_npy(self.interval_path, intervals)
 
     def downsample(self, x, y, num_points):
+        # y may also hold one channel per row, all of them are downsampled at once.
         factor = len(x) // num_points
         x_downsampled = x[:factor * num_points].reshape(-1, factor).mean(axis=1)
-        y_downsampled = y[:factor * num_points].reshape(-1, factor).mean(axis=1)
+        y_downsampled = y[..., :factor * num_points].reshape(y.shape[:-1] + (-1, factor)).mean(axis=-1)
+        return x_downsampled, y_downsampled
+
+    def downsample_implicit(self, y, num_points):
+        # Same as downsample(np.arange(n) / sample_rate, y, num_points) without the time axis: the mean time of a
+        # group is the time of its middle. The groups are averaged in float64 from views of y, without copies.
+        factor = y.shape[-1] // num_points
+        x_downsampled = (np.arange(num_points) * factor + (factor - 1) / 2) / self.sample_rate
+        y_downsampled = y[..., :factor * num_points].reshape(y.shape[:-1] + (-1, factor)).mean(axis=-1,
+                                                                                                dtype=np.float64)
         return x_downsampled, y_downsampled
 
     def baseline_removal(self, y):
-        window_size = 1000
-        baseline = np.convolve(y, np.ones(window_size)/window_size, mode='same')
+        baseline = BASELINE_ESTIMATORS[self.baseline_method].function(y, self.baseline_window)
         corrected_signal = y - baseline
         corrected_signal[corrected_signal < 0] = 0
         return corrected_signal
 
-    def _generate_data_array(self):
-        if self.data is None:
+    def _cache_key(self, stage):
+        if self._file_digest is None:
+            self._file_digest = self.cache.file_digest(self.csv_file_path)
+        # Each stage is keyed by the parameters of all stages up to it, so changing e.g. the peak thresholds still
+        # reuses the cached baseline.
+        parameters = dict(file=self._file_digest, sample_rate=self.sample_rate, baseline_method=self.baseline_method,
+                          baseline_window=self.baseline_window, channels=2)
+        if self.low_memory:
+            # float32 results
+            parameters.update(low_memory=True)
+        if stage in ("downsample", "candidates"):
+            parameters.update(num_points=self.num_points)
+        if stage == "candidates":
+            parameters.update(full_rate=self.full_rate, min_height=self._candidate_height())
+            if self.full_rate:
+                # Equally high peaks closer than the distance are chosen between by position since "first" was added
+                parameters.update(distance=self.full_rate_peak_distance, ties="first")
+        return self.cache.key(stage, **parameters)
+
+    def _cache_get(self, stage):
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(stage))
+
+    def _cache_put(self, stage, **arrays):
+        if self.cache is not None:
+            self.cache.put(self._cache_key(stage), arrays)
+
+    def _load(self, progress):
+        self.load_data(progress)
+        if self.data is None and not (self.streaming and Path(self.csv_file_path).suffix == ".csv"):
+            raise ValueError(f"Could not load '{self.csv_file_path}'")
+
+    def _remove_baselines(self, progress):
+        # Correct both channels together, one second at a time, with the same context samples around each window as
+        # in streaming mode, so the result equals correcting the whole signal at once. The short windows keep the
+        # time between stop checks short even for the slower estimators. Estimators that need the whole signal at
+        # once cannot be stopped midway. The result has one channel per row, so that each channel is contiguous.
+        length = len(self.data)
+        if BASELINE_ESTIMATORS[self.baseline_method].context is None or length == 0:
+            if self.low_memory:
+                self.y_array = np.empty((2, length), dtype=np.float32)
+                self._subtract_baseline(self.data, self.y_array)
+            else:
+                self.y_array = np.ascontiguousarray(self.baseline_removal(self.data).T)
+            return
+        self.y_array = None
+        if self.low_memory:
+            self.y_array = np.empty((2, length), dtype=np.float32)
+        for start, end, context_start, context in self.iter_signal_windows(length, self.sample_rate):
+            window = slice(start - context_start, end - context_start)
+            if self.low_memory:
+                self._subtract_baseline(context, self.y_array[:, start:end], window)
+            else:
+                corrected = self.baseline_removal(context)[window]
+                if self.y_array is None:
+                    self.y_array = np.empty((2, length), dtype=corrected.dtype)
+                self.y_array[:, start:end] = corrected.T
+            progress.update(end / length)
+
+    def _subtract_baseline(self, y, out, window=slice(None)):
+        # Same as baseline_removal(y)[window].T, but written into the rows of `out` without a corrected copy: the
+        # difference of every channel is rounded into its row and clipped there.
+        baseline = BASELINE_ESTIMATORS[self.baseline_method].function(y, self.baseline_window)
+        for channel, row in enumerate(out):
+            np.subtract(y[window, channel], baseline[window, channel], out=row, casting="same_kind")
+            np.maximum(row, 0, out=row)
+
+    def _generate_data_array(self, progress=None, update_chart_overview=None):
+        # With update_chart_overview, quick looks at the raw signal are drawn while it is loaded.
+        progress = progress or StageProgress()
+        downsampled = self._cache_get("downsample")
+        if self.streaming:
+            # Loading, baseline removal and downsampling are done in the same pass over the signal.
+            with progress.stage("load", "baseline", "downsample"):
+                if downsampled is None:
+                    self._quick_look_file(update_chart_overview)
+                    self._load(progress)
+                    self._quick_look_data(update_chart_overview)
+                    self._generate_data_array_streaming(progress)
+        else:
+            corrected = self._cache_get("baseline")
+            with progress.stage("load"):
+                if corrected is None:
+                    self._quick_look_file(update_chart_overview)
+                    self._load(progress)
+                    self._quick_look_data(update_chart_overview)
+            with progress.stage("baseline"):
+                if corrected is None:
+                    self._remove_baselines(progress)
+                    self._cache_put("baseline", y=self.y_array)
+                else:
+                    self.y_array = corrected["y"]
+                self.y1_array, self.y2_array = self.y_array
+            with progress.stage("downsample"):
+                # Low-memory mode keeps the time axis implicit
+                self.x_array = None if self.low_memory else np.arange(self.y_array.shape[1])/self.sample_rate
+                if downsampled is None:
+                    if self.low_memory:
+                        x_downsampled, y_downsampled = self.downsample_implicit(self.y_array, self.num_points)
+                    else:
+                        x_downsampled, y_downsampled = self.downsample(self.x_array, self.y_array, self.num_points)
+                    self.x_array_downsampled = x_downsampled
+                    self.y1_array_downsampled, self.y2_array_downsampled = y_downsampled
+                    progress.update(0.5)
+                self.pyramid_y1 = MinMaxPyramid(self.y1_array, self.sample_rate)
+                self.pyramid_y2 = MinMaxPyramid(self.y2_array, self.sample_rate)
+
+        if downsampled is None:
+            if self.x_array_downsampled is not None:
+                self._cache_put("downsample", x=self.x_array_downsampled, y1=self.y1_array_downsampled,
+                                y2=self.y2_array_downsampled)
+        else:
+            self.x_array_downsampled = downsampled["x"]
+            self.y1_array_downsampled = downsampled["y1"]
+            self.y2_array_downsampled = downsampled["y2"]
+
+    def _quick_look_file(self, update_chart_overview):
+        # Draw a CSV-file before it is parsed, from rows parsed at a few hundred places of the file, coarse first. The
+        # finest quick look is drawn from the parsed samples.
+        if update_chart_overview is None or Path(self.csv_file_path).suffix != ".csv":
+            return
+        for points in refinement_points(self.quick_look_points)[:-1]:
+            x, rows = csv_quick_look(self.csv_file_path, self.sample_rate, points)
+            if len(x):
+                update_chart_overview.emit(["Sensor 1", "Sensor 2"], x, rows, rows)
+
+    def _quick_look_data(self, update_chart_overview):
+        # Draw the loaded or memory mapped samples from every n-th row, coarse first. Signal containers are drawn at
+        # once from the minima and maxima of their chunk index, without reading any samples.
+        if update_chart_overview is None or self.data is None or len(self.data) == 0:
+            return
+        if read_header(self.csv_file_path) is not None:
+            update_chart_overview.emit(["Sensor 1", "Sensor 2"],
+                                       *SignalContainer(self.csv_file_path).overview(self.quick_look_points))
+            return
+        levels = refinement_points(self.quick_look_points)
+        if Path(self.csv_file_path).suffix == ".csv":
+            levels = levels[-1:]
+        for points in levels:
+            x, rows = strided_quick_look(self.data, self.sample_rate, points)
+            update_chart_overview.emit(["Sensor 1", "Sensor 2"], x, rows, rows)
+
+    def _generate_data_array_streaming(self, progress):
+        # Same result as _generate_data_array, but only one window of the full rate signal is in memory at a time.
+        # Windows are whole multiples of the downsampling factor, so every downsampled point is averaged from exactly
+        # the same samples as in a whole-file run.
+        length = self.signal_length()
+        factor = length // self.num_points
+        if factor == 0:
             return
-        self.x_array = np.arange(len(self.data))/50000
-        self.y1_array = self.baseline_removal(self.data[:, 0])
-        self.y2_array = self.baseline_removal(self.data[:, 1])
-        num_points = 5000
-        self.x_array_downsampled, self.y1_array_downsampled = self.downsample(self.x_array, self.y1_array, num_points)
-        _, self.y2_array_downsampled = self.downsample(self.x_array, self.y2_array, num_points)
+        stop = factor * self.num_points
+        window_size = max(self.window_size // factor, 1) * factor
+        if len(self.x_array) < window_size:
+            self.x_array = np.zeros((window_size,))
+            self.y1_array = np.zeros_like(self.x_array)
+            self.y2_array = np.zeros_like(self.x_array)
+        self.x_array_downsampled = np.empty(self.num_points)
+        self.y1_array_downsampled = np.empty(self.num_points)
+        self.y2_array_downsampled = np.empty(self.num_points)
+
+        for start, end, context_start, context in self.iter_signal_windows(stop, window_size):
+            n = end - start
+            window = slice(start - context_start, end - context_start)
+            downsampled = slice(start // factor, end // factor)
+            x = np.divide(np.arange(start, end), self.sample_rate, out=self.x_array[:n])
+            y1 = self.y1_array[:n]
+            y2 = self.y2_array[:n]
+            corrected = self.baseline_removal(context)[window]
+            y1[:] = corrected[:, 0]
+            y2[:] = corrected[:, 1]
+            self.x_array_downsampled[downsampled] = x.reshape(-1, factor).mean(axis=1)
+            self.y1_array_downsampled[downsampled] = y1.reshape(-1, factor).mean(axis=1)
+            self.y2_array_downsampled[downsampled] = y2.reshape(-1, factor).mean(axis=1)
+            progress.update(end / stop)
 
     def start(self,
               set_chart_axis_y=None,
               update_chart=None,
               update_chart_peaks=None,
               update_peak_counts=None,
-              progress_callback=None):
+              progress_callback=None,
+              update_chart_pyramid=None,
+              stats_callback=None,
+              update_chart_overview=None):
+        # Run the analysis stages: load, baseline, downsample, detect, classify and export. Progress of every stage is
+        # reported through progress_callback, and stop() ends the run at the next check. Returns False if the run was
+        # stopped and True if it ran to the end. With self.instrumentation set, the statistics of every stage are also
+        # emitted through stats_callback. In progressive mode quick looks at the raw signal are emitted through
+        # update_chart_overview as (names, x, mins, maxs) while it is loaded. The time to the first and to the final
+        # chart update are kept in self.paint_times.
         self.running = True
-        self._generate_data_array()
+        if self.instrumentation and stats_callback:
+            self.instrumentation.emit = stats_callback.emit
+        progress = StageProgress(progress_callback.emit if progress_callback else None, lambda: self.running,
+                                 instrumentation=self.instrumentation)
+        self.paint_times = PaintTimes(self.instrumentation)
+        set_chart_axis_y, update_chart, update_chart_peaks, update_peak_counts, update_chart_pyramid = (
+            self.paint_times.track(output)
+            for output in (set_chart_axis_y, update_chart, update_chart_peaks, update_peak_counts, update_chart_pyramid)
+        )
+        update_chart_overview = self.paint_times.track(update_chart_overview) if self.progressive else None
+        try:
+            self._generate_data_array(progress, update_chart_overview)
 
-        if update_chart:
-            update_chart.emit("Sensor 1", self.x_array_downsampled, self.y1_array_downsampled)
+            if update_chart_pyramid:
+                update_chart_pyramid.emit("Sensor 1", self.pyramid_y1)
+                update_chart_pyramid.emit("Sensor 2", self.pyramid_y2)
 
-        if set_chart_axis_y:
-            set_chart_axis_y.emit(float(self.y1_array_downsampled.min()), float(self.y1_array_downsampled.max()))
+            if update_chart:
+                update_chart.emit("Sensor 1", self.x_array_downsampled, self.y1_array_downsampled)
+                update_chart.emit("Sensor 2", self.x_array_downsampled, self.y2_array_downsampled)
 
-        self.detect_and_classify_peaks(update_chart_peaks)
+            if set_chart_axis_y:
+                set_chart_axis_y.emit(
+                    float(min(self.y1_array_downsampled.min(), self.y2_array_downsampled.min())),
+                    float(max(self.y1_array_downsampled.max(), self.y2_array_downsampled.max()))
+                )
 
-        if update_peak_counts:
-            update_peak_counts.emit(
-                self.peak_counter.large_peaks,
-                self.peak_counter.medium_peaks,
-                self.peak_counter.small_peaks
+            self.detect_and_classify_peaks(update_chart_peaks, progress)
+
+            if update_peak_counts:
+                update_peak_counts.emit(
+                    self.peak_counter.large_peaks,
+                    self.peak_counter.medium_peaks,
+                    self.peak_counter.small_peaks
+                )
+            self.paint_times.final()
+
+            with progress.stage("export"):
+                print('Writing output CSV...')
+                self.write_result_csv()
+        except AnalysisCancelled:
+            self._release_arrays()
+            if progress_callback:
+                progress_callback.emit(0)
+            return False
+        finally:
+            self.running = False
+            if self.instrumentation:
+                self.instrumentation.close()
+        return True
+
+    def analyze(self, stats_callback=None, **outputs):
+        # Run start() and return this analyzer with its results, or None if the run was stopped. Run in a separate
+        # process (see process_job.py), the analyzer comes back as a copy whose large arrays are in shared memory. The
+        # samples of the file are not needed by the results and are dropped first, and so is the instrumentation,
+        # whose statistics have been emitted already.
+        if not self.start(stats_callback=stats_callback, **outputs):
+            return None
+        self.data = None
+        self.instrumentation = None
+        return self
+
+    def _release_arrays(self):
+        # Drop the signal and the partial results of a stopped run.
+        self.data = None
+        self.x_array = self.y1_array = self.y2_array = np.zeros(0)
+        self.y_array = None
+        self.x_array_downsampled = self.y1_array_downsampled = self.y2_array_downsampled = None
+        self.candidates_y1 = self.candidates_y2 = None
+        self.peaks_y1 = self.peaks_y2 = None
+        self.coincidences = None
+        self.peak_store = None
+        self.pyramid_y1 = self.pyramid_y2 = None
+
+    def _candidate_height(self):
+        return min(self.min_peak_height, self.peak_height)
+
+    def _find_candidates(self, progress, update_chart_peaks=None):
+        # Return the PeakCandidates of both sensors, every peak down to the candidate height with its prominence.
+        min_height = self._candidate_height()
+        if self.full_rate:
+            # Full rate signals are split into chunks, and the chunks of both sensors share one process pool. The
+            # candidates are selected by distance already, which leaves a fraction of the local maxima to compute
+            # the prominence of.
+            channels = (self.y1_array, self.y2_array)
+            maxima = [float(np.max(y)) for y in channels]
+            provisional = None
+            if update_chart_peaks and not self.require_coincidence:
+                # Draw the sensor 1 peaks of the chunks done so far. Without their pairing with sensor 2, which needs
+                # all peaks, they could include peaks that are not counted when only coincident peaks are.
+                provisional = ProvisionalPeaks(
+                    self.y1_array, self.sample_rate, maxima[0], self.peak_height, self.peak_prominence,
+                    self.peak_counter.classifier, lambda store: update_chart_peaks.emit("Sensor 1", store)
+                )
+            found = find_peaks_parallel_channels(
+                channels,
+                heights=[min_height * max_y for max_y in maxima],
+                distance=self.full_rate_peak_distance,
+                workers=self.workers,
+                progress=progress.update,
+                on_chunk=provisional.add if provisional else None
             )
+            return [
+                PeakCandidates(peaks, properties['peak_heights'], properties['prominences'], max_y, min_height,
+                               self.full_rate_peak_distance)
+                for (peaks, properties), max_y in zip(found, maxima)
+            ]
+        return [find_candidates(y / np.max(y), min_height) for y in (self.y1_array_downsampled,
+                                                                     self.y2_array_downsampled)]
 
-        print('Writing output CSV...')
-        self.write_result_csv()
+    def _peak_times(self, peaks):
+        if self.full_rate:
+            return peaks / self.sample_rate
+        return self.x_array_downsampled[peaks]
 
-        if progress_callback:
-            progress_callback.emit(100)
+    def _selected_peaks(self):
+        # Sensor 1 peaks that are counted and exported
+        if self.require_coincidence:
+            return self.coincidences.sensor1
+        return slice(None)
 
-    def detect_and_classify_peaks(self, update_chart_peaks=None):
-        normalized_y1 = self.y1_array_downsampled / np.max(self.y1_array_downsampled)
+    def _pair(self, peaks_y1, peaks_y2):
+        # Pair the peaks the two sensors see at the same time. The tolerance is at least one sample.
+        if self.full_rate:
+            resolution = 1 / self.sample_rate
+        else:
+            resolution = self.x_array_downsampled[1] - self.x_array_downsampled[0]
+        return match_coincident_peaks(
+            self._peak_times(peaks_y1), self._peak_times(peaks_y2), max(self.coincidence_tolerance, resolution)
+        )
 
-        self.peaks_y1, properties = find_peaks(
-            normalized_y1,
-            height=0.015 * np.max(normalized_y1),
-            prominence=0.015,
-            distance=2
+    def _select_peaks(self):
+        # Filter the candidates with the peak settings, which gives the same peaks as find_peaks with them.
+        distance = self.full_rate_peak_distance if self.full_rate else self.peak_distance
+        self.selected_y1, self.selected_y2 = (
+            candidates.select(self.peak_height, self.peak_prominence, distance)
+            for candidates in (self.candidates_y1, self.candidates_y2)
         )
+        self.peaks_y1 = self.candidates_y1.peaks[self.selected_y1]
+        self.peaks_y2 = self.candidates_y2.peaks[self.selected_y2]
+        self.coincidences = self._pair(self.peaks_y1, self.peaks_y2)
 
-        peak_x_y1 = self.x_array_downsampled[self.peaks_y1]
-        peak_y_y1 = self.y1_array_downsampled[self.peaks_y1]
-        peak_heights_y1 = properties['peak_heights']
+    def _classify_peaks(self, update_chart_peaks=None):
+        selected = self.selected_y1[self._selected_peaks()]
+        peaks_y1 = self.candidates_y1.peaks[selected]
+        peak_heights_y1 = self.candidates_y1.relative_heights[selected]
+        peak_x_y1 = self._peak_times(peaks_y1)
+        peak_y_y1 = self.y1_array[peaks_y1] if self.full_rate else self.y1_array_downsampled[peaks_y1]
 
-        peaks_data = np.column_stack((peak_x_y1, peak_y_y1, peak_heights_y1))
+        peak_classes = self.peak_counter.count_peaks(peak_heights_y1)
+        self.peak_store = PeakStore(
+            peak_x_y1, peak_y_y1, peak_heights_y1, self.candidates_y1.prominences[selected] / self.candidates_y1.scale,
+            peak_classes.codes, peak_classes.names
+        )
 
         if update_chart_peaks:
-            update_chart_peaks.emit("Sensor 1", peak_x_y1, peaks_data)
+            update_chart_peaks.emit("Sensor 1", self.peak_store)
+
+    def detect_and_classify_peaks(self, update_chart_peaks=None, progress=None):
+        progress = progress or StageProgress()
+        with progress.stage("detect"):
+            cached = self._cache_get("candidates")
+            if cached is None:
+                self.candidates_y1, self.candidates_y2 = self._find_candidates(
+                    progress, update_chart_peaks if self.progressive else None
+                )
+                arrays = {}
+                for name, candidates in (("y1", self.candidates_y1), ("y2", self.candidates_y2)):
+                    arrays.update({f"{field}_{name}": value for field, value in candidates._asdict().items()})
+                    # 0 for no distance selection, as the cache stores plain arrays
+                    arrays[f"distance_{name}"] = candidates.distance or 0
+                self._cache_put("candidates", **arrays)
+            else:
+                self.candidates_y1, self.candidates_y2 = (
+                    PeakCandidates(cached[f"peaks_{name}"], cached[f"heights_{name}"], cached[f"prominences_{name}"],
+                                   float(cached[f"scale_{name}"]), float(cached[f"min_height_{name}"]),
+                                   int(cached[f"distance_{name}"]) or None)
+                    for name in ("y1", "y2")
+                )
+            self._select_peaks()
+
+        with progress.stage("classify"):
+            self._classify_peaks(update_chart_peaks)
+
+    def set_peak_settings(self, **settings):
+        # Change the peak detection and classification settings: peak_height, peak_prominence, peak_distance,
+        # full_rate_peak_distance, coincidence_tolerance, require_coincidence and class_edges.
+        for name, value in settings.items():
+            if name == "class_edges":
+                self.peak_counter = PeakCounter(PeakClassifier(value))
+            elif name in PEAK_SETTINGS:
+                setattr(self, name, value)
+            else:
+                raise TypeError(f"Unknown peak setting '{name}'")
+
+    def reclassify(self, update_chart_peaks=None, update_peak_counts=None, **settings):
+        # Apply new peak settings to the candidates of the last run without detecting the peaks again, and update
+        # the chart markers, the counts and peak_store. The peak height cannot go below the candidate height, and in
+        # full rate mode the distance cannot change, as the candidates were selected with it. Settings that are
+        # rejected leave the analyzer as it was.
+        previous = {name: getattr(self, name) for name in PEAK_SETTINGS}
+        previous_counter = self.peak_counter
+        try:
+            self.set_peak_settings(**settings)
+            self._select_peaks()
+        except (TypeError, ValueError):
+            for name, value in previous.items():
+                setattr(self, name, value)
+            self.peak_counter = previous_counter
+            raise
+        self._classify_peaks(update_chart_peaks)
+        if update_peak_counts:
+            update_peak_counts.emit(
+                self.peak_counter.large_peaks,
+                self.peak_counter.medium_peaks,
+                self.peak_counter.small_peaks
+            )
 
-        self.peak_counter.count_peaks(peak_heights_y1)
+    def sweep_peak_settings(self, heights, prominences, distances=None, class_edges=None):
+        # Count the peaks of every combination of the settings from the candidates of the last run, leaving the
+        # analyzer as it is. The prominence filter comes last, so the height and distance filters are applied once
+        # for all prominences. Returns one dict per combination with the settings, the number of sensor 1 peaks of
+        # each class as counted by the analysis (i.e. only coincident ones with require_coincidence), and the number
+        # of sensor 2 and coincident peaks. In full rate mode only the distance of the analysis can be swept.
+        classifier = PeakClassifier(class_edges) if class_edges is not None else self.peak_counter.classifier
+        if distances is None:
+            distances = [self.full_rate_peak_distance if self.full_rate else self.peak_distance]
+        rows = []
+        for height in heights:
+            for distance in distances:
+                before_y1, before_y2 = (
+                    candidates.select_by_height_and_distance(height, distance)
+                    for candidates in (self.candidates_y1, self.candidates_y2)
+                )
+                for prominence in prominences:
+                    selected_y1, selected_y2 = (
+                        before[candidates.prominences[before] >= prominence * candidates.scale]
+                        for before, candidates in ((before_y1, self.candidates_y1), (before_y2, self.candidates_y2))
+                    )
+                    coincidences = self._pair(self.candidates_y1.peaks[selected_y1],
+                                              self.candidates_y2.peaks[selected_y2])
+                    if self.require_coincidence:
+                        selected_y1 = selected_y1[coincidences.sensor1]
+                    codes = classifier.codes(self.candidates_y1.relative_heights[selected_y1])
+                    counts = np.bincount(codes, minlength=len(classifier.names))
+                    rows.append({
+                        "height": float(height),
+                        "prominence": float(prominence),
+                        "distance": distance,
+                        **{name: int(count) for name, count in zip(classifier.names, counts)},
+                        "sensor2_peaks": len(selected_y2),
+                        "coincident_peaks": len(coincidences.sensor1),
+                    })
+        return rows
 
     def stop(self):
         self.running = False
\ No newline at end of file
@@ -13,9 +13,9 @@ from PySide6.QtCore import Qt, QThreadPool
 from PySide6.QtGui import QCloseEvent
 from PySide6.QtWidgets import QApplication, QFileDialog, QMainWindow, QProgressDialog
 
+from idp2023_example.process_worker import ProcessWorker
 from idp2023_example.signal_app_widget import SignalAppWidget
 from idp2023_example.signal_converter import SignalConverter
-from idp2023_example.worker import Worker
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -54,7 +54,7 @@ class SignalAppMainWindow(QMainWindow):
             self,
             self.tr("Open Industrial Project signal file"),
             str(self.last_dir),  # ok, Qt seems to like path strings
-            self.tr("Signal files (*.csv *.npy)"),
+            self.tr("Signal files (*.csv *.sig *.npy)"),
             self.selected_open_filter,
         )
         signal_path = Path(signal_path)  # but I like pathlib.Path
@@ -72,8 +72,8 @@ class SignalAppMainWindow(QMainWindow):
         converted_signal_path, self.selected_save_filter = QFileDialog.getSaveFileName(
             self,
             self.tr("Save Industrial Project signal file"),
-            str(self.signal_path.with_suffix(".npy")),
-            self.tr("Signal files (*.npy)"),
+            str(self.signal_path.with_suffix(".sig")),
+            self.tr("Signal files (*.sig)"),
             self.selected_save_filter,
         )
         if not converted_signal_path:
@@ -92,15 +92,19 @@ class SignalAppMainWindow(QMainWindow):
         # Get a threadpool
         threadpool = QThreadPool.globalInstance()
 
-        # Prepare a signal converter thread. The thread emit progress signals to update the progress dialog.
-        # Start the thread after everything has been set up.
+        # Prepare a signal converter. The parsing runs in a separate process so that it does not slow down the user
+        # interface, and a thread of the pool emits its progress signals to update the progress dialog. Cancelling
+        # the dialog cancels the converter in that process. Start the worker after everything has been set up.
         converter = SignalConverter()
-        worker = Worker(
-            converter.start, source_signal_path=self.signal_path, target_signal_path=self.converted_signal_path
+        worker = ProcessWorker(
+            converter.start,
+            source_signal_path=self.signal_path,
+            target_signal_path=self.converted_signal_path,
+            cancel=converter.cancel
         )
         worker.signals.progress.connect(progress.setValue)
         worker.signals.result.connect(self._converter_finished)
-        progress.canceled.connect(converter.cancel)
+        progress.canceled.connect(worker.cancel)
         progress.setValue(0)
         threadpool.start(worker)
         logger.debug("File->Convert: conversion process launched")
@@ -1,17 +1,27 @@
+from pathlib import Path
+
 import numpy as np
-from PySide6.QtCore import QThreadPool, Signal, Slot
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton
+from PySide6.QtCore import Signal, Slot
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QProgressBar, QCheckBox
 
+from idp2023_example.analysis_cache import AnalysisCache
+from idp2023_example.analysis_scheduler import AnalysisScheduler
+from idp2023_example.instrumentation import Instrumentation
+from idp2023_example.live_analyzer import LiveAnalyzer, ReplaySource
+from idp2023_example.peak_settings_widget import PeakSettingsWidget
 from idp2023_example.signal_analyzer import SignalAnalyzer
+from idp2023_example.signal_container import SignalContainer, read_header
 from idp2023_example.signal_window_chart_widget import SignalWindowChartWidget
-from idp2023_example.worker import Worker
+from idp2023_example.stage_stats_widget import StageStatsWidget
 
 
 class SignalAppWidget(QWidget):
     chart_set_axis_y = Signal(float, float)
     chart_update_data = Signal(str, np.ndarray, np.ndarray)
-    chart_update_peaks = Signal(str, np.ndarray, np.ndarray)
+    chart_update_peaks = Signal(str, object)
     chart_update_peak_counts = Signal(int, int, int)
+    chart_update_pyramid = Signal(str, object)
+    chart_show_overview = Signal(list, object, object, object)
 
     def __init__(self):
         super().__init__()
@@ -22,6 +32,8 @@ class SignalAppWidget(QWidget):
         self.chart_update_data.connect(self.signal_window_chart.replace_array)
         self.chart_update_peaks.connect(self.signal_window_chart.add_peak_markers)
         self.chart_update_peak_counts.connect(self.signal_window_chart.update_peak_counts)
+        self.chart_update_pyramid.connect(self.signal_window_chart.set_pyramid)
+        self.chart_show_overview.connect(self.signal_window_chart.show_overview)
 
         self.start_button = QPushButton("Start")
         self.stop_button = QPushButton("Stop")
@@ -29,25 +41,135 @@ class SignalAppWidget(QWidget):
         self.start_button.pressed.connect(self.start_signal_analyser)
         self.stop_button.pressed.connect(self.stop_signal_analyser)
 
+        # Progress of the analysis stages, reset to 0 when the analysis is stopped
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+
+        # Optional per-stage statistics. The analysis is instrumented only while they are shown.
+        self.stats_check_box = QCheckBox("Show stage statistics")
+        self.stage_stats = StageStatsWidget()
+        self.stage_stats.setVisible(False)
+        self.stats_check_box.toggled.connect(self.stage_stats.setVisible)
+
+        # Replays the signal file at its sample rate through the live analysis instead of analysing it at once
+        self.live_check_box = QCheckBox("Live replay")
+
+        # Draws a quick look at the raw signal while the file is loaded, and the peaks of the full rate detection as
+        # they are found (see SignalAnalyzer.progressive)
+        self.quick_look_check_box = QCheckBox("Quick look while analysing")
+        self.quick_look_check_box.setChecked(True)
+
+        # Runs the analysis in a process of its own, so that it does not slow down the window
+        self.process_check_box = QCheckBox("Analyse in a separate process")
+
+        # Peak settings and class edges. Moving a slider reclassifies the peaks of the last analysis at once, and the
+        # settings apply to the following analyses.
+        self.peak_settings = PeakSettingsWidget()
+        self.peak_settings.settings_changed.connect(self.reclassify_peaks)
+
         self.layout = QVBoxLayout(self)
         self.layout.addWidget(self.start_button)
         self.layout.addWidget(self.stop_button)
+        self.layout.addWidget(self.progress_bar)
+        self.layout.addWidget(self.live_check_box)
+        self.layout.addWidget(self.quick_look_check_box)
+        self.layout.addWidget(self.process_check_box)
+        self.layout.addWidget(self.peak_settings)
+        self.layout.addWidget(self.stats_check_box)
+        self.layout.addWidget(self.stage_stats)
         self.layout.addWidget(self.signal_window_chart)
 
-        self.threadpool = QThreadPool()
-        self.signal_analyzer = SignalAnalyzer("../group4.csv")
+        # Runs one analysis at a time and lets only the newest one update the chart
+        self.scheduler = AnalysisScheduler(max_concurrent=1, parent=self)
+        self.scheduler.progress.connect(self.progress_bar.setValue)
+        self.scheduler.result.connect(self.print_output)
+        self.scheduler.result.connect(self.analysis_finished)
+        self.scheduler.error.connect(self.handle_worker_error)
+        self.scheduler.stats.connect(self.stage_stats.add_stats)
+        self.signal_path = None
+        # Analyzer of the newest finished analysis, whose peaks the sliders reclassify
+        self.signal_analyzer = None
+        # Keyword arguments of SignalAnalyzer for the next analysis
+        self.analyzer_options = {}
+        # Reopening a file, or rerunning it with other peak settings, reuses the results of the earlier runs.
+        self.analysis_cache = AnalysisCache()
+
+    def set_signal_path(self, signal_path: Path):
+        self.stop_signal_analyser()
+        self.signal_path = signal_path
+        self.signal_analyzer = None
+        if read_header(signal_path) is not None:
+            # The raw signal of a converted recording is shown right away, drawn from its chunk index alone.
+            container = SignalContainer(signal_path)
+            pixels = int(self.signal_window_chart.chart.plotArea().width()) or 1000
+            self.signal_window_chart.show_overview(["Sensor 1", "Sensor 2"], *container.overview(pixels))
 
     def start_signal_analyser(self):
-        worker = Worker(
-            self.signal_analyzer.start,
+        if self.signal_path is None:
+            print("No signal file opened.")
+            return
+        # Every run gets its own analyzer, so that a stopped run that is still winding down shares nothing with the
+        # new one. Pressing Start again while the same analysis is queued or running does not start another one.
+        signal_analyzer = SignalAnalyzer(self.signal_path, cache=self.analysis_cache, **self.analyzer_options)
+        signal_analyzer.set_peak_settings(**self.peak_settings.settings())
+        signal_analyzer.progressive = self.quick_look_check_box.isChecked()
+        if self.live_check_box.isChecked():
+            self.start_live_replay(signal_analyzer)
+            return
+        self.signal_analyzer = None
+        if self.stats_check_box.isChecked():
+            signal_analyzer.instrumentation = Instrumentation()
+        self.scheduler.backend = "process" if self.process_check_box.isChecked() else "thread"
+        submitted = self.scheduler.submit(
+            (str(self.signal_path), self.scheduler.backend, signal_analyzer.progressive,
+             tuple(sorted(self.analyzer_options.items()))),
+            signal_analyzer.analyze,
+            signal_analyzer.stop,
+            set_chart_axis_y=self.chart_set_axis_y,
+            update_chart=self.chart_update_data,
+            update_chart_peaks=self.chart_update_peaks,
+            update_peak_counts=self.chart_update_peak_counts,
+            update_chart_pyramid=self.chart_update_pyramid,
+            update_chart_overview=self.chart_show_overview
+        )
+        if submitted:
+            self.stage_stats.clear_stats()
+
+    def start_live_replay(self, signal_analyzer: SignalAnalyzer):
+        live_analyzer = LiveAnalyzer(ReplaySource(self.signal_path, signal_analyzer.sample_rate), signal_analyzer)
+        # The replay is paced by the clock and shows its analyzer as it goes, so it stays in this process.
+        self.scheduler.backend = "thread"
+        submitted = self.scheduler.submit(
+            ("live", str(self.signal_path), tuple(sorted(self.analyzer_options.items()))),
+            live_analyzer.start,
+            live_analyzer.stop,
             set_chart_axis_y=self.chart_set_axis_y,
             update_chart=self.chart_update_data,
             update_chart_peaks=self.chart_update_peaks,
-            update_peak_counts=self.chart_update_peak_counts
+            update_peak_counts=self.chart_update_peak_counts,
+            update_chart_pyramid=self.chart_update_pyramid
+        )
+        if submitted:
+            self.stage_stats.clear_stats()
+
+    @Slot(object)
+    def analysis_finished(self, signal_analyzer):
+        # The analyzer of a finished analysis, or None if it was stopped. The live replay returns its statistics.
+        if isinstance(signal_analyzer, SignalAnalyzer):
+            self.signal_analyzer = signal_analyzer
+            self.reclassify_peaks()
+
+    @Slot()
+    def reclassify_peaks(self):
+        # Apply the current slider values to the peaks of the newest analysis, if it has finished.
+        analyzer = self.signal_analyzer
+        if analyzer is None or analyzer.running or analyzer.candidates_y1 is None:
+            return
+        analyzer.reclassify(
+            update_chart_peaks=self.chart_update_peaks,
+            update_peak_counts=self.chart_update_peak_counts,
+            **self.peak_settings.settings()
         )
-        worker.signals.result.connect(self.print_output)
-        worker.signals.error.connect(self.handle_worker_error)
-        self.threadpool.start(worker)
 
     def print_output(self, data):
         print("Data sent to chart:", data)
@@ -59,4 +181,4 @@ class SignalAppWidget(QWidget):
 
     @Slot()
     def stop_signal_analyser(self):
-        self.signal_analyzer.stop()
\ No newline at end of file
+        self.scheduler.cancel()
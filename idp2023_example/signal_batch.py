@@ -0,0 +1,177 @@
+"""Headless batch analysis of many signal files.
+
+Usage example:
+     signal_batch --output-dir results --jobs 4 "recordings/*.csv" extra/recording.npy
+
+Every input file is analysed with SignalAnalyzer in a pool of worker processes. The detections of each file are
+written into the output directory as `<name>_detections.csv`, and a `summary.csv` with the run time and the peak
+counts of every file is written next to them. This module does not use Qt.
+"""
+
+import argparse
+import csv
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from idp2023_example.analysis_cache import AnalysisCache
+from idp2023_example.baseline_estimators import BASELINE_ESTIMATORS
+from idp2023_example.instrumentation import Instrumentation
+from idp2023_example.process_pool import pool_context
+from idp2023_example.signal_analyzer import SignalAnalyzer
+
+SUMMARY_FIELDS = [
+    "file",
+    "output",
+    "seconds",
+    "large_peaks",
+    "medium_peaks",
+    "small_peaks",
+    "sensor2_peaks",
+    "coincident_peaks",
+    "error",
+]
+
+
+def expand_inputs(patterns: list[str]) -> list[Path]:
+    """Expand the glob patterns into a sorted list of files, keeping plain paths as they are."""
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        paths.extend(Path(match) for match in matches)
+    return sorted(set(paths))
+
+
+def output_paths(signal_paths: list[Path], output_dir: Path) -> list[Path]:
+    """Name the detection file of each input after it, numbering files that share the same name."""
+    outputs = []
+    used = set()
+    for signal_path in signal_paths:
+        output = output_dir / f"{signal_path.stem}_detections.csv"
+        number = 1
+        while output in used:
+            number += 1
+            output = output_dir / f"{signal_path.stem}_{number}_detections.csv"
+        used.add(output)
+        outputs.append(output)
+    return outputs
+
+
+def analyze_file(
+    signal_path: Path, output_path: Path, analyzer_options: dict, intervals: bool = False, trace: bool = False
+) -> dict:
+    """Run the analysis pipeline on one file. Errors are reported in the summary instead of stopping the batch.
+
+    With `trace` the stages are instrumented and written as a Chrome trace into `<name>_trace.json`.
+    """
+    started = time.perf_counter()
+    summary = {"file": str(signal_path), "output": str(output_path)}
+    try:
+        interval_path = output_path.with_name(output_path.name.replace("_detections.csv", "_intervals.npy"))
+        analyzer = SignalAnalyzer(
+            signal_path, output_path=output_path, interval_path=interval_path if intervals else None,
+            **analyzer_options
+        )
+        if trace:
+            analyzer.instrumentation = Instrumentation()
+        analyzer.start()
+        if trace:
+            analyzer.instrumentation.write_chrome_trace(
+                output_path.with_name(output_path.name.replace("_detections.csv", "_trace.json"))
+            )
+        summary.update(
+            large_peaks=analyzer.peak_counter.large_peaks,
+            medium_peaks=analyzer.peak_counter.medium_peaks,
+            small_peaks=analyzer.peak_counter.small_peaks,
+            sensor2_peaks=len(analyzer.peaks_y2),
+            coincident_peaks=len(analyzer.coincidences.sensor1),
+        )
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def run_batch(
+    signal_paths: list[Path],
+    output_dir: Path,
+    jobs: int | None = None,
+    intervals: bool = False,
+    trace: bool = False,
+    **analyzer_options,
+) -> list[dict]:
+    """Analyse the files in at most `jobs` worker processes and write `summary.csv` into the output directory.
+
+    With `intervals` the detections are also saved as `<name>_intervals.npy` structured arrays, and with `trace` the
+    time and memory use of the stages of every file as `<name>_trace.json`.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = output_paths(signal_paths, output_dir)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=pool_context()) as executor:
+        futures = [
+            executor.submit(analyze_file, signal_path, output_path, analyzer_options, intervals, trace)
+            for signal_path, output_path in zip(signal_paths, outputs)
+        ]
+        summaries = []
+        for future in futures:
+            summary = future.result()
+            if "error" in summary:
+                print(f"{summary['file']}: {summary['error']}")
+            else:
+                print(
+                    f"{summary['file']}: {summary['seconds']:.3f} s, {summary['large_peaks']} large, "
+                    f"{summary['medium_peaks']} medium, {summary['small_peaks']} small peaks"
+                )
+            summaries.append(summary)
+
+    with (output_dir / "summary.csv").open("w", newline="") as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse signal files without the user interface.")
+    parser.add_argument("inputs", nargs="+", help="signal files (.csv or converted) or glob patterns")
+    parser.add_argument("-o", "--output-dir", type=Path, default=Path("."), help="directory for the result files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of files analysed in parallel")
+    parser.add_argument("--sample-rate", type=int, default=None,
+                        help="sample rate of files that do not record it (default 50000)")
+    parser.add_argument("--baseline", choices=sorted(BASELINE_ESTIMATORS), default="moving_average")
+    parser.add_argument("--streaming", action="store_true", help="process each file window by window")
+    parser.add_argument("--low-memory", action="store_true", help="keep the corrected signals in float32")
+    parser.add_argument("--full-rate", action="store_true", help="detect peaks at the native sample rate")
+    parser.add_argument("--require-coincidence", action="store_true",
+                        help="count only sensor 1 peaks that sensor 2 sees at the same time")
+    parser.add_argument("--intervals", action="store_true", help="also save the detections as .npy arrays")
+    parser.add_argument("--trace", action="store_true", help="save per-stage timings as Chrome trace files")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="reuse intermediate results stored here")
+    args = parser.parse_args(argv)
+
+    signal_paths = expand_inputs(args.inputs)
+    if not signal_paths:
+        parser.error("no input files found")
+
+    summaries = run_batch(
+        signal_paths,
+        args.output_dir,
+        jobs=args.jobs,
+        intervals=args.intervals,
+        trace=args.trace,
+        sample_rate=args.sample_rate,
+        baseline_method=args.baseline,
+        streaming=args.streaming,
+        low_memory=args.low_memory,
+        full_rate=args.full_rate,
+        require_coincidence=args.require_coincidence,
+        cache=AnalysisCache(args.cache_dir) if args.cache_dir else None,
+        # The files are already analysed in parallel, don't start another pool per file.
+        workers=1,
+    )
+    return 1 if any("error" in summary for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+"""Benchmark of the analysis stages on a synthetic recording.
+
+Usage example:
+     signal_benchmark --seconds 120 --output benchmark.json
+     signal_benchmark --baseline benchmarks/baseline.json --save-baseline   # record the reference results
+     signal_benchmark --baseline benchmarks/baseline.json                   # exits with 1 on a regression
+
+The first stage is the cold start of a new interpreter that imports the analysis, as a batch job or a pool process
+does; it fails if Qt is imported on the way. Then a deterministic two-channel recording is generated with
+`synthetic_signal.generate_signal` and every stage of the pipeline is run on it in turn: conversion into a signal
+container, CSV and container loading, baseline removal, downsampling, peak detection and classification on the
+downsampled and the full rate signal, writing the detections, feeding the chart, and finally the whole analysis from
+the container file, also in low-memory mode, and from the CSV-file in progressive mode. Each stage is timed `--repeat`
+times, and run once more under tracemalloc to measure its peak allocation. The progressive run also reports the time
+to its first chart update and to the final peaks, as the stages `pipeline_progressive_first_paint` and
+`pipeline_progressive_final`. Results are written as JSON and can be compared with a stored baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+
+from idp2023_example.signal_analyzer import SignalAnalyzer
+from idp2023_example.signal_converter import SignalConverter
+from idp2023_example.synthetic_signal import generate_signal, write_signal_csv
+
+# Imports the numeric pipeline in a fresh interpreter and fails if that pulls in Qt
+COLD_START = """
+import sys
+import idp2023_example.signal_analyzer, idp2023_example.signal_converter, idp2023_example.signal_batch
+sys.exit("PySide6 was imported by the analysis" if "PySide6" in sys.modules else 0)
+"""
+
+
+class _Recorder:
+    # Stands in for a Qt signal and keeps the last emitted values
+    def __init__(self):
+        self.args = None
+
+    def emit(self, *args):
+        self.args = args
+
+
+def _stages(csv_path: Path, binary_path: Path, output_dir: Path, sample_rate: int,
+            workers: int | None) -> list[tuple[str, Callable[[], dict[str, float] | None]]]:
+    # Every stage can be run repeatedly: it starts from the state the previous stages left and replaces its own
+    # results. A stage may return further timings of its run, by name.
+    analyzer = SignalAnalyzer(binary_path, sample_rate=sample_rate, output_path=output_dir / "detections.csv")
+    full_rate = SignalAnalyzer(binary_path, sample_rate=sample_rate, full_rate=True, workers=workers,
+                               output_path=output_dir / "detections_full_rate.csv")
+    csv_analyzer = SignalAnalyzer(csv_path, sample_rate=sample_rate)
+    peaks = _Recorder()
+    chart = {}
+
+    def cold_start():
+        subprocess.run([sys.executable, "-c", COLD_START], check=True)
+
+    def convert():
+        converter = SignalConverter()
+        converter.sample_rate = sample_rate
+        converter.start(csv_path, binary_path)
+
+    def load_csv():
+        csv_analyzer.load_data()
+
+    def load_binary():
+        analyzer.load_data()
+
+    def baseline():
+        analyzer.y_array = np.ascontiguousarray(analyzer.baseline_removal(analyzer.data).T)
+        analyzer.y1_array, analyzer.y2_array = analyzer.y_array
+
+    def downsample():
+        analyzer.x_array = np.arange(len(analyzer.data)) / sample_rate
+        analyzer.x_array_downsampled, y_downsampled = analyzer.downsample(
+            analyzer.x_array, analyzer.y_array, analyzer.num_points
+        )
+        analyzer.y1_array_downsampled, analyzer.y2_array_downsampled = y_downsampled
+
+    def detect():
+        analyzer.detect_and_classify_peaks(peaks)
+
+    def detect_full_rate():
+        full_rate.x_array, full_rate.y1_array, full_rate.y2_array = analyzer.x_array, *analyzer.y_array
+        full_rate.detect_and_classify_peaks()
+
+    def write_csv():
+        analyzer.write_result_csv()
+
+    def chart_feed():
+        from PySide6.QtWidgets import QApplication
+        from idp2023_example.lod_pyramid import MinMaxPyramid
+        from idp2023_example.signal_window_chart_widget import SignalWindowChartWidget
+
+        if "widget" not in chart:
+            chart["application"] = QApplication.instance() or QApplication([])
+            chart["widget"] = SignalWindowChartWidget()
+        widget = chart["widget"]
+        widget.set_pyramid("Sensor 1", MinMaxPyramid(analyzer.y1_array, sample_rate))
+        widget.replace_array("Sensor 1", analyzer.x_array_downsampled, analyzer.y1_array_downsampled)
+        widget.add_peak_markers(*peaks.args)
+        widget.refresh_visible_range()
+        chart["application"].processEvents()
+
+    def pipeline():
+        SignalAnalyzer(binary_path, sample_rate=sample_rate, output_path=output_dir / "detections.csv").start()
+
+    def pipeline_low_memory():
+        SignalAnalyzer(binary_path, sample_rate=sample_rate, output_path=output_dir / "detections.csv",
+                       low_memory=True).start()
+
+    def pipeline_progressive():
+        progressive = SignalAnalyzer(csv_path, sample_rate=sample_rate, output_path=output_dir / "detections.csv",
+                                     progressive=True)
+        outputs = ("update_chart", "update_chart_peaks", "update_chart_overview")
+        progressive.start(**{name: _Recorder() for name in outputs})
+        return {"first_paint": progressive.paint_times.first_paint, "final": progressive.paint_times.final_paint}
+
+    return [
+        ("cold_start", cold_start),
+        ("convert", convert),
+        ("load_csv", load_csv),
+        ("load_binary", load_binary),
+        ("baseline", baseline),
+        ("downsample", downsample),
+        ("detect", detect),
+        ("detect_full_rate", detect_full_rate),
+        ("write_csv", write_csv),
+        ("chart", chart_feed),
+        ("pipeline", pipeline),
+        ("pipeline_low_memory", pipeline_low_memory),
+        ("pipeline_progressive", pipeline_progressive),
+    ]
+
+
+def run_benchmark(seconds: float = 120.0, sample_rate: int = 50000, repeat: int = 3, seed: int = 0,
+                  workers: int | None = None, work_dir: Path | None = None) -> dict:
+    """Generate the test recording, run every stage and return the results as a JSON-compatible dict."""
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        work_dir = Path(work_dir or temporary_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        csv_path = work_dir / f"synthetic_{seconds:g}s_{seed}.csv"
+        if not csv_path.exists():
+            write_signal_csv(csv_path, generate_signal(seconds, sample_rate, seed=seed))
+
+        stages = {}
+        for name, stage in _stages(csv_path, work_dir / "synthetic.sig", work_dir, sample_rate, workers):
+            times = []
+            timings = {}
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for timing, elapsed in (stage() or {}).items():
+                    timings.setdefault(f"{name}_{timing}", []).append(elapsed)
+                times.append(time.perf_counter() - started)
+            # A separate run for the memory, as tracing the allocations slows the stage down.
+            tracemalloc.start()
+            stage()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stages[name] = {"seconds": min(times), "median_seconds": statistics.median(times), "peak_bytes": peak}
+            print(f"{name:>32}: {min(times):8.3f} s {peak / 2**20:10.1f} MiB")
+            for timing, runs in timings.items():
+                stages[timing] = {"seconds": min(runs), "median_seconds": statistics.median(runs), "peak_bytes": 0}
+                print(f"{timing:>32}: {min(runs):8.3f} s")
+
+    return {
+        "config": {"seconds": seconds, "sample_rate": sample_rate, "repeat": repeat, "seed": seed, "workers": workers},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """Return a description of every stage that is more than `tolerance` slower or larger than in the baseline.
+
+    Differences below 10 ms and 1 MiB are ignored, as they are within the noise of the small stages.
+    """
+    regressions = []
+    for name, stage in results["stages"].items():
+        reference = baseline["stages"].get(name)
+        if reference is None:
+            continue
+        if stage["seconds"] > reference["seconds"] * (1 + tolerance) + 0.01:
+            regressions.append(f"{name}: {stage['seconds']:.3f} s, baseline {reference['seconds']:.3f} s")
+        if stage["peak_bytes"] > reference["peak_bytes"] * (1 + tolerance) + 2**20:
+            regressions.append(
+                f"{name}: {stage['peak_bytes'] / 2**20:.1f} MiB, baseline {reference['peak_bytes'] / 2**20:.1f} MiB"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages on a synthetic recording.")
+    parser.add_argument("--seconds", type=float, default=120.0, help="length of the synthetic recording")
+    parser.add_argument("--sample-rate", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of every stage, the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes for the full rate peak detection")
+    parser.add_argument("--work-dir", type=Path, default=None, help="keep the generated files here")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="write the results into this JSON-file")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON-file of the results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown or growth")
+    args = parser.parse_args(argv)
+
+    # The chart stage needs no display
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    results = run_benchmark(args.seconds, args.sample_rate, args.repeat, args.seed, args.workers, args.work_dir)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.baseline is None:
+        return 0
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2))
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["config"] != results["config"]:
+        print(f"Warning: the baseline was recorded with {baseline['config']}", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression in {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
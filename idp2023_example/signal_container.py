@@ -0,0 +1,204 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"IDPSIG\x00\x01"
+# Bytes reserved for the magic and the JSON header at the start of the file, so that the samples start page aligned.
+HEADER_SIZE = 4096
+# 0.16 s at 50 kHz: fine enough for an overview of a long recording, while the index stays under 0.1 % of the file.
+DEFAULT_CHUNK_SIZE = 1 << 13
+
+
+def index_dtype(dtype: np.dtype) -> np.dtype:
+    # One entry per chunk and channel
+    return np.dtype([("min", dtype), ("max", dtype), ("mean", np.float64)])
+
+
+def read_header(path: str | Path | None) -> dict | None:
+    """Return the header of a signal container file, or None if the file is not one."""
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as container_file:
+            head = container_file.read(HEADER_SIZE)
+    except OSError:
+        return None
+    if not head.startswith(MAGIC):
+        return None
+    return json.loads(head[len(MAGIC):].rstrip(b"\0 "))
+
+
+def _chunk_stats(samples: np.ndarray, chunk_size: int, dtype: np.dtype) -> np.ndarray:
+    # Statistics of consecutive chunks of `chunk_size` rows; the last chunk may be shorter.
+    starts = np.arange(0, len(samples), chunk_size)
+    stats = np.empty((len(starts), samples.shape[1]), dtype=index_dtype(dtype))
+    stats["min"] = np.minimum.reduceat(samples, starts)
+    stats["max"] = np.maximum.reduceat(samples, starts)
+    lengths = np.diff(np.append(starts, len(samples)))
+    stats["mean"] = np.add.reduceat(samples, starts, dtype=np.float64) / lengths[:, None]
+    return stats
+
+
+class SignalContainerWriter:
+    """Write samples into a self-describing signal container file block by block.
+
+    The file holds a header with the sample rate, channel names, dtype and length, the samples in row-major order, and
+    an index with the minimum, maximum and mean of every channel in each chunk of `chunk_size` rows. The index and the
+    final header are written by `close`, so the number of samples need not be known in advance. `abort` removes the
+    file instead, as does leaving the `with` block with an exception, so an incomplete recording never gets a header.
+
+    Usage example:
+         with SignalContainerWriter("recording.sig", sample_rate=50000) as writer:
+             for block in blocks:
+                 writer.write(block)
+    """
+
+    def __init__(self, path: str | Path, sample_rate: int, channels: tuple[str, ...] = ("adc1", "adc2"),
+                 dtype=np.int16, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self.channels = tuple(channels)
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.length = 0
+        # Rows of the chunk that is not complete yet, and the index entries of the complete chunks
+        self.pending = np.empty((0, len(self.channels)), dtype=self.dtype)
+        self.stats: list[np.ndarray] = []
+        self.file = self.path.open("wb")
+        self.file.write(bytes(HEADER_SIZE))
+
+    def write(self, samples: np.ndarray):
+        samples = np.ascontiguousarray(samples, dtype=self.dtype).reshape(-1, len(self.channels))
+        self.file.write(samples.tobytes())
+        self.length += len(samples)
+
+        # Fill up the pending chunk first, then take the statistics of all complete chunks of the block at once.
+        fill = min(self.chunk_size - len(self.pending), len(samples))
+        if fill < self.chunk_size:
+            self.pending = np.concatenate((self.pending, samples[:fill]))
+            samples = samples[fill:]
+            if len(self.pending) < self.chunk_size:
+                return
+            self.stats.append(_chunk_stats(self.pending, self.chunk_size, self.dtype))
+        complete = len(samples) // self.chunk_size * self.chunk_size
+        if complete:
+            self.stats.append(_chunk_stats(samples[:complete], self.chunk_size, self.dtype))
+        self.pending = samples[complete:].copy()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if len(self.pending):
+            self.stats.append(_chunk_stats(self.pending, self.chunk_size, self.dtype))
+            self.pending = self.pending[:0]
+        index = np.concatenate(self.stats) if self.stats else np.empty((0, len(self.channels)),
+                                                                       dtype=index_dtype(self.dtype))
+        index_offset = HEADER_SIZE + self.length * len(self.channels) * self.dtype.itemsize
+        self.file.write(index.tobytes())
+
+        header = json.dumps({
+            "version": 1,
+            "sample_rate": self.sample_rate,
+            "channels": list(self.channels),
+            "dtype": self.dtype.str,
+            "length": self.length,
+            "chunk_size": self.chunk_size,
+            "chunks": len(index),
+            "data_offset": HEADER_SIZE,
+            "index_offset": index_offset,
+        }).encode()
+        if len(MAGIC) + len(header) > HEADER_SIZE:
+            raise ValueError("The container header does not fit in its reserved space")
+        self.file.seek(0)
+        self.file.write(MAGIC + header)
+        self.file.close()
+
+    def abort(self):
+        """Close and remove the file without finalizing it."""
+        if not self.file.closed:
+            self.file.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class SignalContainer:
+    """Read a signal container file written by SignalContainerWriter.
+
+    The samples and the chunk index are memory mapped, so opening a container reads only its header. Any time range
+    can be read directly, and `overview` summarizes the whole recording from the index alone, without touching the
+    samples.
+
+    Usage example:
+         container = SignalContainer("recording.sig")
+         samples = container.read(10.0, 20.0)           # (rows, channels) samples of 10-20 s
+         x, mins, maxs = container.overview(1200)       # envelope of the whole recording for 1200 pixels
+    """
+
+    def __init__(self, path: str | Path):
+        header = read_header(path)
+        if header is None:
+            raise ValueError(f"'{path}' is not a signal container file")
+        self.path = Path(path)
+        self.header = header
+        self.sample_rate = header["sample_rate"]
+        self.channels = tuple(header["channels"])
+        self.dtype = np.dtype(header["dtype"])
+        self.length = header["length"]
+        self.chunk_size = header["chunk_size"]
+        channels = len(self.channels)
+        if self.length:
+            self.data = np.memmap(path, dtype=self.dtype, mode="r", offset=header["data_offset"],
+                                  shape=(self.length, channels))
+        else:
+            self.data = np.empty((0, channels), dtype=self.dtype)
+        if header["chunks"]:
+            self.index = np.memmap(path, dtype=index_dtype(self.dtype), mode="r", offset=header["index_offset"],
+                                   shape=(header["chunks"], channels))
+        else:
+            self.index = np.empty((0, channels), dtype=index_dtype(self.dtype))
+
+    @property
+    def duration(self) -> float:
+        return self.length / self.sample_rate
+
+    def sample_range(self, start_seconds: float, stop_seconds: float) -> tuple[int, int]:
+        start = int(np.clip(np.floor(start_seconds * self.sample_rate), 0, self.length))
+        stop = int(np.clip(np.ceil(stop_seconds * self.sample_rate), start, self.length))
+        return start, stop
+
+    def read(self, start_seconds: float, stop_seconds: float) -> np.ndarray:
+        """Samples of the time range [start_seconds, stop_seconds); only those pages of the file are read."""
+        start, stop = self.sample_range(start_seconds, stop_seconds)
+        return self.data[start:stop]
+
+    def chunk_stats(self, start_seconds: float, stop_seconds: float) -> np.ndarray:
+        """Index entries of the chunks that overlap the time range."""
+        start, stop = self.sample_range(start_seconds, stop_seconds)
+        return self.index[start // self.chunk_size:-(-stop // self.chunk_size)]
+
+    def overview(self, points: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Minimum and maximum of every channel in at most `points` equal parts of the recording, from the index.
+
+        Returns the center time of every part and (parts, channels) arrays of the minima and maxima.
+        """
+        chunks = len(self.index)
+        group = max(-(-chunks // max(int(points), 1)), 1)
+        starts = np.arange(0, chunks, group)
+        if chunks == 0:
+            empty = np.empty((0, len(self.channels)), dtype=self.dtype)
+            return np.empty(0), empty, empty
+        mins = np.minimum.reduceat(self.index["min"], starts)
+        maxs = np.maximum.reduceat(self.index["max"], starts)
+        first_sample = starts * self.chunk_size
+        last_sample = np.minimum((starts + group) * self.chunk_size, self.length)
+        centers = (first_sample + last_sample - 1) / 2 / self.sample_rate
+        return centers, mins, maxs
@@ -1,14 +1,20 @@
-import csv
+import io
 from pathlib import Path
 
 import numpy as np
-from PySide6.QtCore import Signal
+
+from idp2023_example.csv_ingest import column_indices
+from idp2023_example.emitter import Emitter
+from idp2023_example.instrumentation import Instrumentation, measure
+from idp2023_example.signal_container import SignalContainerWriter
 
 
 class SignalConverter:
-    """Convert a CSV-signal file into a binary data file.
+    """Convert a CSV-signal file into a signal container file (see signal_container.py).
 
-    This SignalConverter is intended to be run as a thread within an instance of the `Worker`-class.
+    This SignalConverter is intended to be run as a thread within an instance of the `Worker`-class, or in a process
+    of its own with a `ProcessWorker`, which then calls `cancel` in that process. It does not depend on Qt: without the
+    GUI, progress can be followed through any `Emitter`.
     Usage example:
          # Get a thread pool
          threadpool = QThreadPool.globalInstance()
@@ -29,68 +35,90 @@ class SignalConverter:
     # Flag to indicate the conversion process should be cancelled.
     cancelled: bool = False
 
+    # Number of bytes read from the CSV-file at a time. Each block is parsed in one vectorized call, so the memory use
+    # of the conversion is bounded by the block size regardless of the size of the input file.
+    block_size: int = 16 * 1024 * 1024
+
+    # Names of the columns written into the binary data file, in this order.
+    columns: tuple[str, ...] = ("adc1", "adc2")
+
+    # Sample rate of the CSV-file, which does not record it, stored in the header of the converted file.
+    sample_rate: int = 50000
+
+    # Optional instrumentation that measures the reading, parsing and writing of every block.
+    instrumentation: Instrumentation | None = None
+
     def cancel(self):
         self.cancelled = True
 
     def start(
-        self, source_signal_path: Path, target_signal_path: Path, progress_callback: Signal | None = None
+        self,
+        source_signal_path: Path,
+        target_signal_path: Path,
+        progress_callback: Emitter | None = None,
+        stats_callback: Emitter | None = None,
     ) -> bool:
         self.cancelled = False
+        if self.instrumentation and stats_callback:
+            self.instrumentation.emit = stats_callback.emit
 
         # Make sure the progress is at 0 %
         if progress_callback:
             progress_callback.emit(0)
 
-        # This is terrible: read each row from the file to count the number of rows
-        row_count = 0
-        with source_signal_path.open() as source_signal_file:
-            reader = csv.reader(source_signal_file)
-            next(reader)
-            for row in csv.reader(source_signal_file):
-                if not row:
-                    continue
-                row_count += 1
+        # The CSV-file is read only once, in large blocks. The number of rows is not known beforehand, so instead of
+        # preallocating a memory mapped file the parsed blocks are appended to the end of the container file. Data
+        # type is 16-bit integers, and both adc1 and adc2 are saved in their own columns as in the original file using
+        # C (row-major) order (see f.ex. Wikipedia article on the topic
+        # https://en.wikipedia.org/wiki/Row-_and_column-major_order). The header of the container records the sample
+        # rate, the column names, the dtype and the length, and the chunk index is written after the samples. If the
+        # conversion is cancelled or fails, e.g. on a row that cannot be parsed, the partially written file is removed
+        # instead, so it is never opened as a shorter recording.
+        total_bytes = max(source_signal_path.stat().st_size, 1)
+        with source_signal_path.open("rb") as source_signal_file, SignalContainerWriter(
+            target_signal_path, self.sample_rate, self.columns
+        ) as target_signal_file:
+            usecols = column_indices(source_signal_file.readline(), self.columns)
+            remainder = b""
+            while True:
+                with measure(self.instrumentation, "read"):
+                    block = source_signal_file.read(self.block_size)
+                if not block and not remainder:
+                    break
+
+                # Parse only complete lines. The partial line at the end of the block is carried over to the next one.
+                block = remainder + block
+                if block and not block.endswith(b"\n") and source_signal_file.tell() < total_bytes:
+                    cut = block.rfind(b"\n") + 1
+                    block, remainder = block[:cut], block[cut:]
+                else:
+                    remainder = b""
+
+                if block.strip():
+                    with measure(self.instrumentation, "parse"):
+                        data = np.loadtxt(
+                            io.BytesIO(block), delimiter=",", usecols=usecols, dtype=np.int16, ndmin=2, encoding=None
+                        )
+                    with measure(self.instrumentation, "write"):
+                        target_signal_file.write(data)
+
+                if progress_callback:
+                    progress_callback.emit(int(source_signal_file.tell() / total_bytes * 100))
 
                 # Was the process cancelled during our reading?
                 if self.cancelled:
-                    return False
-
-        # Open a memory mapped binary file for writing. Set data type to 16-bit integers. Save both adc1 and adc2
-        # in their own columns as in the original file. Order refers to C and Fortran conventions of multidimensional
-        # array layouts: C uses row-major and Fortran column-major layouts (see f.ex. Wikipedia article on the topic
-        # https://en.wikipedia.org/wiki/Row-_and_column-major_order).
-        # NOTE: the binary file will not contain dtype, shape, or order information. They must be supplied manually.
-        data = np.memmap(target_signal_path, dtype=np.int16, mode="w+", offset=0, shape=(row_count, 2), order="C")
-
-        # Read the CSV-file row-by-row writing it into the binary data file. This approach is slow, but it allows full
-        # control of the reading process - every 50000 points or 1 second of data, the progress bar is updated.
-        # Using some other reader that allows larger chunks could be more efficient than this.
-        with source_signal_path.open() as source_signal_file:
-            reader = csv.reader(source_signal_file)
-            next(reader)
-            for index, row in enumerate(reader):
-                if not row:
-                    continue
-                data[index, :] = row
-                if index % (50000 * 60) == 0:
-                    # Force the data array to write changes to disk. This presumably happens automatically too at
-                    # implementation-defined points, but this the API provided to the numpy users.
-                    data.flush()
-                if progress_callback and index % 50000 == 0:
-                    progress_callback.emit((index / row_count) * 100)
+                    target_signal_file.abort()
+                    break
 
-                if self.cancelled:
-                    del data
-                    target_signal_path.unlink()  # Remove the binary data file
-                    return False
+        if self.instrumentation:
+            self.instrumentation.close()
 
-        data.flush()  # again, once more force the array to write changes to disk
-        if not self.cancelled and progress_callback:
-            # Finish the progress bar.
-            progress_callback.emit(100)
-        if self.cancelled and progress_callback:
-            del data
-            target_signal_path.unlink()
-            progress_callback.emit(0)
+        if self.cancelled:
+            if progress_callback:
+                progress_callback.emit(0)
+            return False
 
-        return not self.cancelled
+        # Finish the progress bar.
+        if progress_callback:
+            progress_callback.emit(100)
+        return True
@@ -1,12 +1,17 @@
 import numpy as np
-from PySide6.QtCharts import QChart, QChartView, QLineSeries, QValueAxis, QScatterSeries
-from PySide6.QtCore import Qt, Slot, QPointF
+from PySide6.QtCharts import QChart, QChartView, QLineSeries, QValueAxis, QScatterSeries, QXYSeries
+from PySide6.QtCore import Qt, Slot, QTimer
 from PySide6.QtGui import QPainter, QColor
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QSizePolicy
 from PySide6.QtCharts import QChartView
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QMouseEvent
 
+from idp2023_example.lod_pyramid import MinMaxPyramid
+from idp2023_example.peak_store import PeakStore
+
+PEAK_COLORS = {"Large peaks": "red", "Medium peaks": "orange", "Small peaks": "green"}
+
 class ZoomableChartView(QChartView):
     def __init__(self, chart, parent=None):
         super().__init__(chart, parent)
@@ -37,6 +42,9 @@ class SignalWindowChartWidget(QWidget):
         super().__init__()
 
         self.series_dict = {}
+        self.peak_series: dict[str, QScatterSeries] = {}
+        self.peak_stores: dict[str, PeakStore] = {}
+        self.pyramids: dict[str, MinMaxPyramid] = {}
         self.axis_x = QValueAxis()
         self.axis_y = QValueAxis()
 
@@ -60,44 +68,47 @@ class SignalWindowChartWidget(QWidget):
         self.axis_y.setTitleText("Amplitude")
         self.chart.addAxis(self.axis_y, Qt.AlignLeft)
 
-    def add_peak_markers(self, name: str, peak_x: np.ndarray, peaks_data: np.ndarray):
-        red_series = QScatterSeries()
-        orange_series = QScatterSeries()
-        green_series = QScatterSeries()
-
-        red_series.setName("Large peaks: 0")
-        orange_series.setName("Medium peaks: 0")
-        green_series.setName("Small peaks: 0")
-
-        red_series.setMarkerSize(7)
-        red_series.setColor(QColor("red"))
-
-        orange_series.setMarkerSize(7)
-        orange_series.setColor(QColor("orange"))
-
-        green_series.setMarkerSize(7)
-        green_series.setColor(QColor("green"))
-
-        for x_val, y_val, height in peaks_data:
-            point = QPointF(float(x_val), float(y_val))
-            if height > 0.3:
-                red_series.append(point)
-            elif height > 0.1:
-                orange_series.append(point)
-            else:
-                green_series.append(point)
-
-        self.chart.addSeries(red_series)
-        red_series.attachAxis(self.axis_x)
-        red_series.attachAxis(self.axis_y)
-
-        self.chart.addSeries(orange_series)
-        orange_series.attachAxis(self.axis_x)
-        orange_series.attachAxis(self.axis_y)
-
-        self.chart.addSeries(green_series)
-        green_series.attachAxis(self.axis_x)
-        green_series.attachAxis(self.axis_y)
+        # Zooming and panning change the x axis range several times per event. Coalesce them into one refresh of the
+        # visible data, done once the event loop is idle again.
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(0)
+        self.refresh_timer.timeout.connect(self.refresh_visible_range)
+        self.axis_x.rangeChanged.connect(self.refresh_timer.start)
+
+    def _get_peak_series(self, name: str) -> QScatterSeries:
+        # The marker series are created on first use and reused by every analysis run.
+        if name not in self.peak_series:
+            series = QScatterSeries()
+            series.setMarkerSize(7)
+            series.setColor(QColor(PEAK_COLORS.get(name, "blue")))
+            self.chart.addSeries(series)
+            series.attachAxis(self.axis_x)
+            series.attachAxis(self.axis_y)
+            self.peak_series[name] = series
+        return self.peak_series[name]
+
+    @Slot(str, object)
+    def add_peak_markers(self, name: str, store: PeakStore):
+        # The markers of the visible range are drawn from the store by refresh_visible_range.
+        self.peak_stores[name] = store
+        # List the largest class first in the legend.
+        for class_name, count in reversed(list(zip(store.names, store.counts()))):
+            self._get_peak_series(class_name).setName(f"{class_name}: {count}")
+        self.refresh_peak_markers()
+
+    def refresh_peak_markers(self):
+        # Draw only the peaks inside the x axis range, at most one of each class per pixel.
+        pixels = int(self.chart.plotArea().width()) or self.chart_view.width()
+        markers: dict[str, list[PeakStore]] = {}
+        for store in self.peak_stores.values():
+            visible = store.thinned(self.axis_x.min(), self.axis_x.max(), pixels)
+            for code, class_name in enumerate(store.names):
+                markers.setdefault(class_name, []).append(visible.class_peaks(code))
+        for class_name, stores in markers.items():
+            self._set_series_data(self._get_peak_series(class_name),
+                                  np.concatenate([peaks.times for peaks in stores]),
+                                  np.concatenate([peaks.amplitudes for peaks in stores]))
 
     @Slot(float, float)
     def set_axis_y(self, min_y: float, max_y: float):
@@ -112,25 +123,58 @@ class SignalWindowChartWidget(QWidget):
         series.attachAxis(self.axis_y)
         self.series_dict[name] = series
 
+    def _set_series_data(self, series: QXYSeries, x: np.ndarray, y: np.ndarray):
+        # Hand the numpy buffers to Qt in one call instead of building QPointF objects one by one.
+        series.replaceNp(np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64))
+
+    @Slot(str, object)
+    def set_pyramid(self, name: str, pyramid: MinMaxPyramid | None):
+        if pyramid is None:
+            self.pyramids.pop(name, None)
+            return
+        if name not in self.series_dict:
+            self.add_series(name)
+        self.pyramids[name] = pyramid
+        self.refresh_visible_range()
+
+    @Slot()
+    def refresh_visible_range(self):
+        # Replace the data of every series that has a pyramid with the level and slice matching the visible range,
+        # i.e. one or two points per pixel of the plot area, and the peak markers with the visible ones.
+        pixels = int(self.chart.plotArea().width()) or self.chart_view.width()
+        for name, pyramid in self.pyramids.items():
+            x, y = pyramid.query(self.axis_x.min(), self.axis_x.max(), pixels)
+            self._set_series_data(self.series_dict[name], x, y)
+        self.refresh_peak_markers()
+
     @Slot(str, np.ndarray, np.ndarray)
     def replace_array(self, name: str, x: np.ndarray, y: np.ndarray):
         if name not in self.series_dict:
             self.add_series(name)
         series = self.series_dict[name]
-        points = [QPointF(float(xi), float(yi)) for xi, yi in zip(x, y)]
-        series.replace(points)
+        if name not in self.pyramids:
+            self._set_series_data(series, x, y)
         self.axis_x.setMin(float(x.min()))
         self.axis_x.setMax(float(x.max()))
         self.axis_y.setMin(float(y.min()))
         self.axis_y.setMax(float(y.max()))
 
+    @Slot(list, object, object, object)
+    def show_overview(self, names: list[str], x: np.ndarray, mins: np.ndarray, maxs: np.ndarray):
+        # Draw the minimum and maximum of every part of the recording, one column of mins and maxs per series in
+        # `names`, e.g. from the chunk index of a signal container before the analysis has run, or a quick look at
+        # the raw signal while it is loaded. The peak markers of an earlier analysis are removed.
+        self.peak_stores.clear()
+        for series in self.peak_series.values():
+            series.clear()
+        for column, name in enumerate(names):
+            self.pyramids.pop(name, None)
+            self.replace_array(name, np.repeat(x, 2), np.column_stack((mins[:, column], maxs[:, column])).ravel())
+        if len(x):
+            self.set_axis_y(float(mins.min()), float(maxs.max()))
+
     @Slot(int, int, int)
     def update_peak_counts(self, large: int, medium: int, small: int):
-        for series in self.chart.series():
-            if isinstance(series, QScatterSeries):
-                if "Large peaks" in series.name():
-                    series.setName(f"Large peaks: {large}")
-                elif "Medium peaks" in series.name():
-                    series.setName(f"Medium peaks: {medium}")
-                elif "Small peaks" in series.name():
-                    series.setName(f"Small peaks: {small}")
\ No newline at end of file
+        for name, count in (("Large peaks", large), ("Medium peaks", medium), ("Small peaks", small)):
+            if name in self.peak_series:
+                self.peak_series[name].setName(f"{name}: {count}")
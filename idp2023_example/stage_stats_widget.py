@@ -0,0 +1,45 @@
+from PySide6.QtCore import Slot
+from PySide6.QtWidgets import QTableWidget, QTableWidgetItem, QHeaderView
+
+from idp2023_example.instrumentation import StageStats
+
+
+class StageStatsWidget(QTableWidget):
+    """Table of the wall time, CPU time and peak allocation of the analysis stages, updated as the stages finish.
+
+    Stages that run several times, like the per-block stages of the converter, are summed into one row.
+
+    Usage example:
+         stats_widget = StageStatsWidget()
+         worker.signals.stats.connect(stats_widget.add_stats)
+    """
+
+    HEADERS = ("Stage", "Wall (ms)", "CPU (ms)", "Peak (MiB)")
+
+    def __init__(self, parent=None):
+        super().__init__(0, len(self.HEADERS), parent)
+        self.setHorizontalHeaderLabels(self.HEADERS)
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.verticalHeader().setVisible(False)
+        self.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.totals: dict[str, StageStats] = {}
+
+    @Slot()
+    def clear_stats(self):
+        self.totals.clear()
+        self.setRowCount(0)
+
+    @Slot(object)
+    def add_stats(self, stats: StageStats):
+        total = self.totals.get(stats.name)
+        if total is None:
+            row = len(self.totals)
+            self.insertRow(row)
+        else:
+            row = list(self.totals).index(stats.name)
+            stats = total._replace(wall=total.wall + stats.wall, cpu=total.cpu + stats.cpu,
+                                   peak_bytes=max(total.peak_bytes, stats.peak_bytes))
+        self.totals[stats.name] = stats
+        values = (stats.name, f"{stats.wall * 1e3:.1f}", f"{stats.cpu * 1e3:.1f}", f"{stats.peak_bytes / 2**20:.1f}")
+        for column, value in enumerate(values):
+            self.setItem(row, column, QTableWidgetItem(value))
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def generate_signal(
+    seconds: float,
+    sample_rate: int = 50000,
+    drift: float = 150.0,
+    peak_rate: float = 50.0,
+    noise: float = 3.0,
+    seed: int = 0,
+) -> np.ndarray:
+    """Generate a deterministic two-channel recording that looks like the adc1/adc2 data of the measurement device.
+
+    Both channels sit around a level of 2000 with a slow baseline drift of about `drift` counts, white noise of
+    `noise` counts, and `peak_rate` peaks per second on average. Peak amplitudes are log-normally distributed so that
+    small, medium and large peaks all occur; sensor 2 sees every peak about 0.2 ms later and at lower amplitude. The
+    same arguments always give the same signal.
+
+    Returns an (n, 2) int16 array of adc1 and adc2 samples.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+
+    # Slow drift: a few low-frequency sinusoids with random phases
+    baseline = np.zeros(n)
+    for period in (97.0, 31.0, 7.3):
+        baseline += drift / 3 * np.sin(2 * np.pi * t / period + rng.uniform(0, 2 * np.pi))
+
+    # Peak positions from a Poisson process, shaped as Gaussians of 0.2 - 1 ms width
+    peak_count = rng.poisson(peak_rate * seconds)
+    positions = np.sort(rng.integers(0, max(n, 1), peak_count))
+    amplitudes = np.minimum(rng.lognormal(np.log(60.0), 0.9, peak_count), 1000.0)
+    widths = rng.uniform(0.0002, 0.001, peak_count) * sample_rate
+    half = int(np.ceil(4 * widths.max())) if peak_count else 0
+    offsets = np.arange(-half, half + 1)
+
+    signal = np.empty((n, 2))
+    delay = int(0.0002 * sample_rate)
+    for channel, (shift, gain, level) in enumerate(((0, 1.0, 2000.0), (delay, 0.7, 1800.0))):
+        peaks = np.zeros(n)
+        if peak_count:
+            # One row of kernel samples per peak, added at once; samples past the ends of the signal are dropped.
+            index = positions[:, None] + shift + offsets
+            values = amplitudes[:, None] * gain * np.exp(-0.5 * (offsets / widths[:, None]) ** 2)
+            inside = (index >= 0) & (index < n)
+            np.add.at(peaks, index[inside], values[inside])
+        signal[:, channel] = level + baseline + peaks + rng.normal(0.0, noise, n)
+    return np.clip(np.rint(signal), 0, 4095).astype(np.int16)
+
+
+def write_signal_csv(path: str | Path, signal: np.ndarray):
+    """Write the signal as an adc1,adc2 CSV-file like the ones recorded by the measurement device."""
+    pd.DataFrame({"adc1": signal[:, 0], "adc2": signal[:, 1]}).to_csv(path, index=False)
@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: MIT
 
+import inspect
 import sys
 import traceback
 
@@ -21,6 +22,10 @@ class Worker(QRunnable):
     progress signal is expected to pass an integer in 0-100 range. The runner
     function signature must include named argument "progress_callback".
 
+    If the runner function has a named argument "stats_callback", it
+    receives the stats signal, through which an instrumented runner
+    emits the time and memory statistics of each of its stages.
+
     If the runner finishes successfully, a result signal is emitted.
     The result signal will pass the return value of the runner function,
     and may be an arbitrary object.
@@ -31,6 +36,10 @@ class Worker(QRunnable):
 
     After the runner function has exited, regardless of success or failure,
     a finished signal is emitted. The finished signal will pass no data.
+
+    Worker is the Qt side of the analysis: the analyzer and the converter
+    do not import Qt themselves and only call `emit` on the callbacks they
+    are given, which the Worker and the GUI provide as Qt signals.
     """
 
     def __init__(self, fn, *args, **kwargs):
@@ -41,6 +50,8 @@ class Worker(QRunnable):
         self.signals = WorkerSignals()
 
         self.kwargs["progress_callback"] = self.signals.progress
+        if "stats_callback" in inspect.signature(fn).parameters:
+            self.kwargs["stats_callback"] = self.signals.stats
 
     @Slot()
     def run(self):
@@ -20,9 +20,16 @@ class WorkerSignals(QObject):
 
     result:
         object data returned from processing, anything
+
+    progress:
+        int progress in 0-100 range
+
+    stats:
+        StageStats of a finished stage, emitted by instrumented runners
     """
 
     finished = Signal()
     error = Signal(tuple)
     result = Signal(object)
     progress = Signal(int)
+    stats = Signal(object)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from idp2023_example.parallel_peaks import find_peaks_parallel
+
+
+def _equal_height_signal() -> np.ndarray:
+    # Bursts of equally high peaks closer than the distance, separated by quiet stretches where chunks can be cut
+    rng = np.random.default_rng(0)
+    y = np.zeros(200_000)
+    for start in range(1_000, len(y) - 1_000, 2_500):
+        y[start:start + 600:6] = rng.integers(5, 8, 100)
+    return y
+
+
+def test_equal_height_peaks_do_not_depend_on_workers_or_chunks():
+    y = _equal_height_signal()
+    single, _ = find_peaks_parallel(y, height=1, distance=20, workers=1, chunk_size=len(y))
+    serial, _ = find_peaks_parallel(y, height=1, distance=20, workers=1, chunk_size=5_000)
+    parallel, _ = find_peaks_parallel(y, height=1, distance=20, workers=3, chunk_size=5_000)
+    np.testing.assert_array_equal(serial, single)
+    np.testing.assert_array_equal(parallel, single)
+
+
+def test_first_of_equally_high_peaks_is_kept():
+    y = np.zeros(100)
+    y[[20, 30, 60]] = 1
+    peaks, _ = find_peaks_parallel(y, height=0.5, distance=15, workers=1)
+    np.testing.assert_array_equal(peaks, [20, 60])
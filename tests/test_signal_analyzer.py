@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from idp2023_example.signal_analyzer import SignalAnalyzer
+from idp2023_example.synthetic_signal import generate_signal
+
+
+@pytest.fixture
+def analyzer(tmp_path):
+    signal_path = tmp_path / "recording.npy"
+    np.save(signal_path, generate_signal(10, 50000, seed=0))
+    analyzer = SignalAnalyzer(signal_path, output_path=tmp_path / "detections.csv")
+    analyzer.start()
+    return analyzer
+
+
+def test_rejected_reclassify_leaves_the_settings_and_peaks_unchanged(analyzer):
+    peak_height, peak_store = analyzer.peak_height, analyzer.peak_store
+    with pytest.raises(ValueError):
+        analyzer.reclassify(peak_prominence=0.05, peak_height=analyzer.candidates_y1.min_height / 2)
+    assert analyzer.peak_height == peak_height
+    assert analyzer.peak_prominence != 0.05
+    assert analyzer.peak_store is peak_store
+
+    analyzer.reclassify(peak_distance=3)
+    assert analyzer.peak_store is not peak_store